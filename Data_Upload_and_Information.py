@@ -1,182 +1,77 @@
 # Imports
 import streamlit as st
-import pandas as pd
-import numpy as np
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from camels import binning, model, perf, session_frames
+from camels.compact import format_bytes
+from camels.dataset_store import shared_store
+from camels.figure_cache import shared_figure_cache
+from camels.input_loaders import upload_types
+from camels.pipeline import pipeline_pool
+from camels.preview import paged_dataframe, session_preview
+from camels.recalibration import calibration_from_table, calibration_table
+from camels.upload_cache import content_key
+from camels.model import bins_dict, camels_weights, mask
 
 # Page Configuration
 st.set_page_config(page_title='CAMELS and Market Analysis Dashboard',
                    layout='wide')
 
-# Define Market Variables
-@st.cache_data(ttl=7200)
-def loan_loss_provision_market(df):
-
-    df_group = df[['Date', 'Total Provisions','Total Gross Loans']].groupby(by='Date',sort=False).sum()
-    df_group['Market Loan Loss Rate'] = df_group['Total Provisions']/df_group['Total Gross Loans']
-    df_group = df_group.reset_index()
-
-    return df_group
-
-# Define CAMELS Variables
-@st.cache_data(show_spinner='Feature Extraction ... ', ttl=7200)
-def df_var(df):
-
-    # Merging Loan Loss Providion market and Input Data
-    df_all = pd.merge(df,loan_loss_provision_market(df),how='inner',on='Date')
-    df_all = df_all.set_index('Institution Name')
-    df_all = df_all.drop(columns=['Total Provisions_y','Total Gross Loans_y'])
-    df_all = df_all.rename(columns={'Total Provisions_x':'Total Provisions','Total Gross Loans_x':'Total Gross Loans'})
-
-    # Capital Adequacy
-    df_all['Tier 1 Capital Ratio'] = df_all['Tier 1 Capital'] / df_all['RWA']
-    df_all['Debt to Equity Ratio'] = df_all['Total Liabilities'] / df_all['Total Equity']
-
-    # Asset Quality
-    df_all['NPL to Total Gross Loans Ratio'] = df_all['Stage 3 Exposure'] / df_all['Total Gross Loans']
-    df_all['Loan Loss Provision Rate'] = df_all['Total Provisions'] / df_all['Total Gross Loans']
-    df_all['Loan Loss Provision Rate Scaled'] = abs(df_all['Loan Loss Provision Rate']-df_all['Market Loan Loss Rate'])
-
-    # Management Quality
-    df_all['Asset Growth Rate'] = (df_all['Total Assets'] - df_all['Total Assets (t-1)']) / df_all['Total Assets (t-1)']
-    df_all['Asset Growth Rate (t-1)'] = (df_all['Total Assets (t-1)'] - df_all['Total Assets (t-2)']) / df_all['Total Assets (t-2)']
-    df_all['Asset Growth Rate (t-2)'] = (df_all['Total Assets (t-2)'] - df_all['Total Assets (t-3)']) / df_all['Total Assets (t-3)']
-    df_all['Asset Growth Rate 3Y Average'] = df_all[['Asset Growth Rate', 'Asset Growth Rate (t-1)', 'Asset Growth Rate (t-2)']].mean(axis=1)
-    df_all['Efficiency Ratio'] = df_all['Expenses'] / df_all['Net Operating Income']
-
-    # Earnings
-    df_all['Return on Assets (ROA)'] = df_all['Net Income'] / ((df_all['Total Assets'] + df_all['Total Assets (t-1)']) / 2)
-    df_all['Interest Expenses to Interest Income Ratio'] = df_all['Interest Expenses'] / df_all['Interest Income']
-
-    # Liquidity
-    df_all['Cash Ratio'] = df_all['Liquid Assets'] / df_all['Current Liabilities']
-
-    # Sensitivity
-    df_all['Non Interest Income Share'] = df_all['Non Interest Income'] / (df_all['Non Interest Income'] + df_all['Interest Income'])
-
-    # Select CAMELS Variables
-    df_final_var = df_all[[
-        'Date','Tier 1 Capital Ratio','Debt to Equity Ratio','NPL to Total Gross Loans Ratio','Loan Loss Provision Rate Scaled',
-        'Asset Growth Rate 3Y Average','Efficiency Ratio','Return on Assets (ROA)','Interest Expenses to Interest Income Ratio',
-        'Liquidity Coverage Ratio (LCR)','Cash Ratio','Non Interest Income Share'
-    ]]
-
-    return df_final_var
-
-@st.cache_data(ttl=7200)
-def assign_rating_variable(df_final, cvar, bins_dict):
-    # Extract thresholds from bins Dict
-    thr1 = bins_dict[cvar][2]
-    thr2 = bins_dict[cvar][3]
-    thr3 = bins_dict[cvar][4]
-    thr4 = bins_dict[cvar][5]
-    
-    cond = [(df_final[cvar]<=thr1),
-            (df_final[cvar]>thr1) & (df_final[cvar]<=thr2),
-            (df_final[cvar]>thr2) & (df_final[cvar]<=thr3),
-            (df_final[cvar]>thr3) & (df_final[cvar]<=thr4),
-            (df_final[cvar]>thr4),
-            (df_final[cvar].isnull())] # assign worst score (5) if data is missing
-    # Check the variables interpretation, is a higher value better or worse?
-    if bins_dict[cvar][1]:
-        choice = [5,4,3,2,1,5]
-    else:
-        choice = [1,2,3,4,5,5]
-    return cond, choice
-
-@st.cache_data(show_spinner='Model Calculation ... ', ttl=7200)
-def create_df_ratings(df_final, bins_dict):
-
-    df_ratings = df_final.copy(deep=True)
-
-    # Extract numeric subratings
-    for camels_var in df_final.columns[1:]:
-        cond_tier1, choice_tier1 = assign_rating_variable(df_final, camels_var, bins_dict)
-        df_ratings[camels_var] = np.select(cond_tier1, choice_tier1)
-
-    # Composite Final Numeric Rating
-    df_ratings['Composite Final Score'] = (df_ratings.iloc[:,1:]*camels_weights.values).sum(axis=1)
-
-    # Final Rating Score 10 categories (+- added)
-    cond_final_rating = [
-        (df_ratings['Composite Final Score']>=1) & (df_ratings['Composite Final Score']<1.25), # A+
-        (df_ratings['Composite Final Score']>=1.25) & (df_ratings['Composite Final Score']<1.5), # A-
-            
-        (df_ratings['Composite Final Score']>=1.5) & (df_ratings['Composite Final Score']<1.95), # B+
-        (df_ratings['Composite Final Score']>=1.95) & (df_ratings['Composite Final Score']<2.4), # B-
-            
-        (df_ratings['Composite Final Score']>=2.4) & (df_ratings['Composite Final Score']<2.9), # C+
-        (df_ratings['Composite Final Score']>=2.9) & (df_ratings['Composite Final Score']<3.4), # C-
-            
-        (df_ratings['Composite Final Score']>=3.4) & (df_ratings['Composite Final Score']<3.9), # D+
-        (df_ratings['Composite Final Score']>=3.9) & (df_ratings['Composite Final Score']<4.5), # D-
-            
-        (df_ratings['Composite Final Score']>=4.5) & (df_ratings['Composite Final Score']<4.75), # E+
-        (df_ratings['Composite Final Score']>=4.75) & (df_ratings['Composite Final Score']<=5), # E-
-        
-        (df_ratings['Composite Final Score'].isnull()) # assign E- score if data is missing
-    ] 
-
-    # Composite Final Qualitative Rating
-    choice_final_rating =['A+','A-','B+','B-','C+','C-','D+','D-','E+','E-','E-']
-    df_ratings['Final Rating'] = np.select(cond_final_rating, choice_final_rating)
-
-    # Column reorder
-    df_ratings_column_order = [
-        'Date','Final Rating','Composite Final Score',
-        'Tier 1 Capital Ratio','Debt to Equity Ratio',
-        'NPL to Total Gross Loans Ratio','Loan Loss Provision Rate Scaled',
-        'Asset Growth Rate 3Y Average','Efficiency Ratio',
-        'Return on Assets (ROA)','Interest Expenses to Interest Income Ratio', 
-        'Liquidity Coverage Ratio (LCR)','Cash Ratio',
-        'Non Interest Income Share'
-    ]
-        
-    df_ratings = df_ratings.reindex(columns=df_ratings_column_order)
-
-    return df_ratings
-
-# Hard-coded bins for variables
-bins_dict = {'Tier 1 Capital Ratio':       ['expert', True, 0.06, 0.1, 0.14, 0.2], 
-        'Debt to Equity Ratio':            ['expert', False, 6, 8, 10, 12],
-        'NPL to Total Gross Loans Ratio':  ['expert', False, 0.04, 0.08, 0.12, 0.16],
-        'Loan Loss Provision Rate Scaled': ['expert', False, 0.02, 0.04, 0.06, 0.08],
-        'Asset Growth Rate 3Y Average':    ['expert', True, -0.03, 0, 0.03, 0.06],
-        'Efficiency Ratio':                ['expert', False, 0.5, 0.7, 0.9, 1.1],
-        'Return on Assets (ROA)':          ['expert', True, -0.002, 0.001, 0.005, 0.01],
-        'Interest Expenses to Interest Income Ratio': ['expert', False,  0.07, 0.14, 0.21, 0.28],
-        'Liquidity Coverage Ratio (LCR)':  ['expert', True,  1, 1.35, 1.7, 2],
-        'Cash Ratio':                      ['expert', True,  0.075, 0.15, 0.225, 0.3],
-        'Non Interest Income Share':       ['expert', True,  0.1, 0.2, 0.3, 0.4]}
-exp_bins = pd.DataFrame(bins_dict, index=['Binning Method', 'Reverse', '1st_Threshold', '2nd_Threshold', '3rd_Threshold', '4th_Threshold']).T
-
-# Variables Weights
-camels_weights = pd.DataFrame({
-    'Tier 1 Capital Ratio': 0.09,
-    'Debt to Equity Ratio': 0.10,
-    'NPL to Total Gross Loans Ratio': 0.15,
-    'Loan Loss Provision Rate Scaled': 0.11,
-    'Asset Growth Rate 3Y Average': 0.09,
-    'Efficiency Ratio': 0.1,
-    'Return on Assets (ROA)': 0.1,
-    'Interest Expenses to Interest Income Ratio': 0.06, 
-    'Liquidity Coverage Ratio (LCR)': 0.01,
-    'Cash Ratio': 0.07,
-    'Non Interest Income Share': 0.12}, 
-    index = ['Weight']
-)
-
-mask = ['Variable 1', 'Variable 2',
-        'Variable 3', 'Variable 4',
-        'Variable 5', 'Variable 6',
-        'Variable 7', 'Variable 8',
-        'Variable 9', 'Variable 10',
-        'Variable 11']
+# Parsed uploads and derived frames shared by all sessions, keyed by the content hash of the uploaded file
+dataset_store = shared_store()
+
+def session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+# Drops the entries, pipeline and figures of a dataset once no session shows it any more
+def release_dataset(dataset):
+    if dataset_store.release(dataset, session_id()):
+        pipeline_pool().discard(dataset)
+        shared_figure_cache().invalidate(dataset)
+
+# Apply edited thresholds and weights, invalid edits keep the previous calibration
+def apply_calibration():
+    table = st.session_state['calibration'].copy()
+    for row, changes in st.session_state['_calibration_editor']['edited_rows'].items():
+        for col, value in changes.items():
+            table.iloc[int(row), table.columns.get_loc(col)] = value
+    try:
+        calibration_from_table(table)
+    except ValueError as e:
+        st.session_state['calibration_error'] = str(e)
+        return
+    st.session_state['calibration'] = table
+    st.session_state['calibration_error'] = None
+
+def reset_calibration():
+    st.session_state['calibration'] = calibration_table(bins_dict, camels_weights)
+    st.session_state['calibration_error'] = None
+
+# Paged input preview, reruns on its own when the filters, sort or page change
+@st.fragment
+def input_preview(df_input):
+    paged_dataframe(
+        session_preview('input_preview', df_input, st.session_state['panel_index'], st.session_state['dataset_key']),
+        'input_preview', date_filter=True,
+        format=lambda df_window: df_window.style.format(precision=2, thousands=',', decimal='.'),
+        use_container_width=True
+    )
 
 if __name__ == '__main__':
 
+    perf.begin_run('Data Upload and Information')
+
     # Initialize session state for data upload file
     if 'upload' not in st.session_state:
         st.session_state['upload'] = None
+        st.session_state['dataset'] = None
+
+    # Initialize session state for model calibration, defaults to the hard-coded thresholds and weights
+    if 'calibration' not in st.session_state:
+        reset_calibration()
+    model_bins, model_weights = calibration_from_table(st.session_state['calibration'])
+    requested_bins = model_bins # model_bins gets the derived thresholds of data-driven Binning Methods
 
     # File uploader widget
     st.markdown(
@@ -184,57 +79,114 @@ if __name__ == '__main__':
         '>Upload CAMELS Input Data:</div>', 
         unsafe_allow_html=True
     )
-    upload_file = st.file_uploader('Upload File', label_visibility='collapsed', type='xlsx')
+    upload_file = st.file_uploader('Upload File', label_visibility='collapsed', type=upload_types)
+    st.toggle('Incremental re-rating (recompute only new or changed reporting dates)', key='incremental_mode')
+    st.toggle('Compact session storage (categorical labels, int8 subratings, float32 ratios)', key='compact_storage')
+    st.toggle('Derive Total Assets (t-1), (t-2), (t-3) from the panel history (input columns only fill in missing history)', key='derive_lags')
 
-    # If a file is uploaded, save it to session state and reset relevant variables
+    # If a new file is uploaded, save it to session state, reset relevant variables and start its pipeline
     if upload_file:
-        try:
-            df = pd.read_excel(upload_file, sheet_name='Institution_Data')
-            st.session_state['upload'] = df
+        data = upload_file.getvalue()
+        # Derived lags give a dataset of their own, the prefix keeps it apart from the plain one in the figure cache
+        dataset = ('lags-' if st.session_state['derive_lags'] else '') + content_key(data, 'Institution_Data')
+        if dataset != st.session_state.get('dataset'):
+            # Only the previous dataset of this session is released, other datasets keep their entries
+            if st.session_state.get('dataset') is not None:
+                release_dataset(st.session_state['dataset'])
+            dataset_store.hold(dataset, session_id())
+            st.session_state['dataset'] = dataset
             # Reset other session state variables when a new file is uploaded
+            st.session_state['upload'] = None
+            st.session_state['upload_cache_hit'] = False
             st.session_state['expert_bins'] = None
             st.session_state['weights'] = None
             st.session_state['camels_input'] = None
             st.session_state['camels_variables'] = None
             st.session_state['ratings'] = None
             st.session_state['mask'] = None
-            # Clear cache on new data upload
-            st.cache_resource.clear() # fixes plot resizing issue
-        except:
-            st.error('Error loading file. Please be sure to upload an XLSX file format.')
+            st.session_state['panel_index'] = None
+            st.session_state['market_tables'] = None
+            st.session_state['input_statistics'] = None
+            st.session_state['storage_bytes'] = None
+            # Parse, market loss rate, CAMELS variables, ratings and market benchmarks run on the worker pool,
+            # parsed workbooks are cached on disk by content hash and shared with other sessions uploading the same file
+            pipeline_pool().submit(dataset, data, upload_file.name, model_bins, model_weights,
+                                   derive_lags=st.session_state['derive_lags'])
+
+    # Pipeline of the session's dataset, the preview and statistics show as soon as the upload is parsed
+    job = session_frames.session_job()
+    session_frames.pick_up_upload(job)
+    running = job is not None and not job.finished()
+    if st.session_state['upload'] is None and job is not None and job.finished() and job.parsed() and upload_file:
+        # The parsed upload was evicted before this session picked it up, parse it again (a hit of the upload cache)
+        job = pipeline_pool().submit(st.session_state['dataset'], upload_file.getvalue(), upload_file.name, model_bins,
+                                     model_weights, derive_lags=st.session_state['derive_lags'])
+        running = True
+        session_frames.progress(job)
+    elif st.session_state['upload'] is None and job is not None and job.finished():
+        release_dataset(st.session_state['dataset'])
+        st.session_state['dataset'] = None
+        if job.parsed():
+            # Evicted and the file is no longer in the uploader
+            st.warning('The uploaded data is no longer available. Please upload the file again.')
+        else:
+            st.error('Error loading file. Please be sure to upload an XLSX, CSV, Parquet or Arrow file format.')
+    elif st.session_state['upload'] is None and running:
+        session_frames.progress(job)
 
     # If data uploaded in session state perform all functions
     if st.session_state['upload'] is not None:
 
-        # Data Manipulation and Preparation
-        df_input = st.session_state['upload'].copy(deep=True)
-        try:
-            df_final = df_var(df_input)
-        except:
-            st.error('Error in data type!')
-            
-        try:
-            df_ratings = create_df_ratings(df_final, bins_dict)
-        except:
-            st.error(
-                'Please check the following in the .xlsx file:\n'
-                '1. The \'Date\' column is of datetime format\n'
-                '2. The \'Institution Name\' column is of string/object type\n'
-                '3. The rest of the columns are numerical (integer or float type)'
-            )
-            st.stop()
+        # Session frames once the pipeline finished, only the input preview and statistics while it runs
+        if running:
+            df_input = session_frames.update_input()
+        else:
+            try:
+                model_bins, stats = session_frames.update(requested_bins, model_weights)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            df_input = st.session_state['camels_input']
 
-        # Formatting Dates
-        df_input['Date'] = pd.to_datetime(df_input['Date']).dt.strftime('%d-%m-%Y')
-        df_final['Date'] = pd.to_datetime(df_final['Date']).dt.strftime('%d-%m-%Y')
-        df_ratings['Date'] = pd.to_datetime(df_ratings['Date']).dt.strftime('%d-%m-%Y')
-        
         # Dataframe loaded message
         st.markdown(
             '<div style="text-align: center; font-size: 20px; font-family: Arial";'
             '>File uploaded successfully and is stored in memory!</div>', 
             unsafe_allow_html=True
         )
+        if st.session_state.get('upload_cache_hit'):
+            st.markdown(
+                '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";'
+                '>Loaded from cache (file was uploaded before, Excel parsing skipped)</div>', 
+                unsafe_allow_html=True
+            )
+        if running:
+            session_frames.progress(job)
+        elif st.session_state['incremental_mode']:
+            incremental_stats = stats['incremental']
+            st.markdown(
+                '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";'
+                f'>Incremental re-rating: {incremental_stats["computed_dates"]} new or changed date(s) computed '
+                f'({incremental_stats["computed_rows"]} rows), {incremental_stats["reused_dates"]} date(s) reused from history</div>', 
+                unsafe_allow_html=True
+            )
+        else:
+            rating_stats = stats['ratings']
+            st.markdown(
+                '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";'
+                f'>Ratings updated in {rating_stats["seconds"]*1000:.0f} ms '
+                f'({len(rating_stats["rebinned_variables"])} of {rating_stats["variables"]} variables re-binned)</div>', 
+                unsafe_allow_html=True
+            )
+        
+        if not running and st.session_state['compact_storage']:
+            bytes_before, bytes_after = stats['bytes_before'], stats['bytes_after']
+            st.markdown(
+                '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";'
+                f'>Compact session storage: {format_bytes(bytes_before)} reduced to {format_bytes(bytes_after)} '
+                f'({format_bytes(bytes_before - bytes_after)} saved)</div>', 
+                unsafe_allow_html=True
+            )
         
         # Show input dataframe
         # st.markdown('---')
@@ -244,7 +196,8 @@ if __name__ == '__main__':
                 '>Input Dataframe Preview:</div>', 
                 unsafe_allow_html=True
             )
-            st.dataframe(df_input.style.format(precision=2, thousands=',', decimal='.'), use_container_width=True)
+            with perf.stage('Render input preview'):
+                input_preview(df_input)
         
         # Show input dataframe statistics
         # st.markdown('---')
@@ -254,20 +207,48 @@ if __name__ == '__main__':
                 '>Input Dataframe Information and Statistics:</div>', 
                 unsafe_allow_html=True
             )
-            df_info_type = pd.DataFrame(df_input.dtypes).astype(str)
-            df_info_type.rename(columns={0: 'Data Types'}, inplace=True)
-            df_nulls = pd.DataFrame(df_input.isnull().sum())
-            df_nulls.rename(columns={0: 'Null Values Sum'}, inplace=True)
-            df_describe = df_input.describe().T # numeric columns only
-            df_describe.columns = ['Count', 'Mean', 'Min', 'First Quartile', 'Median', 'Third Quartile', 'Max', 'Standard Deviation']
-            concatenated_df = pd.concat([df_info_type, df_nulls, df_describe], axis=1)
-            concatenated_df = concatenated_df.style.format(precision=2, thousands=',', decimal='.')
-            st.dataframe(concatenated_df, use_container_width=True)
+            st.dataframe(st.session_state['input_statistics'].style.format(precision=2, thousands=',', decimal='.'),
+                         use_container_width=True)
 
-        # Saving Final Dataframes to Session State
-        st.session_state['expert_bins'] = exp_bins
-        st.session_state['weights'] = camels_weights
-        st.session_state['camels_input'] = df_input
-        st.session_state['camels_variables'] = df_final
-        st.session_state['ratings'] = df_ratings
-        st.session_state['mask'] = mask
\ No newline at end of file
+        # Edit thresholds and weights, applied on submit
+        with st.expander('**Click here** for Model Calibration (Thresholds and Weights)'):
+            st.markdown(
+                '<div style="text-align: center; font-size: 20px; font-family: Arial";' 
+                '>Model Calibration:</div>', 
+                unsafe_allow_html=True
+            )
+            with st.form('calibration_form', border=False):
+                st.data_editor(
+                    st.session_state['calibration'].set_axis(mask),
+                    column_config={
+                        'Binning Method': st.column_config.SelectboxColumn(
+                            options=binning.binning_methods, required=True,
+                            help='expert: thresholds below, quantile / kmeans-1d: thresholds derived from the uploaded data'
+                        ),
+                        'Reverse': st.column_config.CheckboxColumn(help='Higher values are better'),
+                        'Weight': st.column_config.NumberColumn(min_value=0.0, max_value=1.0, step=0.01),
+                    },
+                    disabled=['_index'],
+                    key='_calibration_editor',
+                    use_container_width=True
+                )
+                st.form_submit_button('Apply', on_click=apply_calibration)
+            st.button('Reset to defaults', on_click=reset_calibration)
+            if st.session_state.get('calibration_error'):
+                st.error(st.session_state['calibration_error'])
+            if abs(model_weights.to_numpy().sum() - 1) > 1e-9:
+                st.warning(f'Weights sum to {model_weights.to_numpy().sum():.2f}, composite scores are not on the 1-5 scale.')
+            derived = [mask[list(model_bins).index(var)] for var in binning.data_driven_variables(model_bins)]
+            if derived and not running: # derived once the pipeline finished
+                st.markdown(
+                    '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";' 
+                    '>Thresholds derived from the uploaded data:</div>', 
+                    unsafe_allow_html=True
+                )
+                st.dataframe(model.bins_frame(model_bins).set_axis(mask).loc[derived], use_container_width=True)
+            fallback = [mask[list(model_bins).index(var)] for var in binning.fallback_variables(requested_bins, model_bins)]
+            if fallback and not running:
+                st.warning('Thresholds derived from the uploaded data are not strictly increasing for ' + ', '.join(fallback)
+                           + ' (too many equal values), their expert thresholds are used instead.')
+
+    perf.sidebar_panel()
@@ -0,0 +1 @@
+# Synthetic data generation and end-to-end timings of the CAMELS pipeline
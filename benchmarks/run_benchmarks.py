@@ -0,0 +1,177 @@
+# End-to-end timings of the CAMELS pipeline on synthetic panels, emitted as JSON
+#
+# Usage:
+#   python -m benchmarks.run_benchmarks --institutions 100 1000 --dates 8 --repeat 3 --output bench.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_panel import synthetic_panel
+from camels import charts, market, model, scoring_service, styling
+from camels.migration import RatingMigrations
+from camels.sensitivity import weight_sensitivity
+from camels.input_loaders import load_upload
+from camels.panel_index import PanelIndex
+from camels.preview import page_sizes
+
+rating_thresholds = {'1st': 1.5, '2nd': 2.4, '3rd': 3.4, '4th': 4.5}
+
+def timed(fn, repeat):
+    # Returns last result and wall times of every repetition
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+def summary(times, rows):
+    return {
+        'seconds_min': min(times),
+        'seconds_median': float(np.median(times)),
+        'repeat': len(times),
+        'rows': rows,
+        'rows_per_second': rows / min(times) if min(times) > 0 else None,
+    }
+
+def bench_panel(n_institutions, n_dates, null_rate, repeat, excel=True, seed=0):
+    df = synthetic_panel(n_institutions, n_dates, null_rate=null_rate, seed=seed)
+    n = len(df)
+    stages = {}
+
+    def stage(name, fn, rows=n):
+        result, times = timed(fn, repeat)
+        stages[name] = summary(times, rows)
+        return result
+
+    # Load, through the same loaders as the upload page (without the upload cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'parquet': os.path.join(tmp, 'panel.parquet')}
+        df.to_parquet(paths['parquet'], index=False)
+        if excel:
+            paths['xlsx'] = os.path.join(tmp, 'panel.xlsx')
+            df.to_excel(paths['xlsx'], sheet_name='Institution_Data', index=False)
+        for fmt, path in paths.items():
+            with open(path, 'rb') as f:
+                data = f.read()
+            stage(f'load_{fmt}', lambda: load_upload(data, path, use_cache=False))
+
+    # Total Assets lags derived from the panel history (lean input without the lag columns)
+    stage('derive_lagged_assets', lambda: model.derive_lagged_assets(df.drop(columns=model.lag_columns)))
+
+    # Model
+    stage('loan_loss_provision_market', lambda: model.loan_loss_provision_market(df))
+    df_final = stage('df_var', lambda: model.df_var(df))
+    df_ratings = stage('create_df_ratings', lambda: model.create_df_ratings(df_final, model.bins_dict))
+
+    # Scoring service micro-batch, one request per institution, each its own market, rated in a single pass
+    requests = [group for _, group in df.groupby('Institution Name', sort=False)]
+    stage('scoring_service_batch', lambda: scoring_service.score_frames(requests))
+
+    # Upload page post-processing
+    def format_dates():
+        out = []
+        for frame in (df, df_final, df_ratings):
+            frame = frame.copy()
+            frame['Date'] = pd.to_datetime(frame['Date']).dt.strftime('%d-%m-%Y')
+            out.append(frame)
+        return out
+    df_input_fmt, df_final_fmt, df_ratings_fmt = stage('format_dates', format_dates)
+    panel_index = stage('panel_index', lambda: PanelIndex.from_frame(df_input_fmt))
+    date = panel_index.dates[-1]
+    n_date = len(panel_index.for_date(date))
+
+    # Market Analysis tables for all dates (upload page), sliced for the latest date (Market Analysis page)
+    market_tables = stage('market_tables', lambda: market.market_tables(df_input_fmt))
+    df_tot_sum, df_tot_market = stage('market_date_tables', lambda: market.market_date_tables(
+        market_tables, panel_index.for_date(date), date), n_date)
+    # Asset-size peer group benchmarks for all dates and groups (first selection of the grouping)
+    stage('peer_market_tables', lambda: market.market_tables(
+        df_input_fmt, market.peer_groups(df_input_fmt, market.asset_size)))
+
+    # Styled tables, colours of all rows plus the rendered Styler of the first page the Market Analysis page shows
+    def styled(table):
+        return table.window(table.data.iloc[:page_sizes[1]]).styler().to_html()
+    stage('styler_rel', lambda: styled(styling.styler_rel(df_tot_market, model.exp_bins)), n_date)
+    stage('styler_abs', lambda: styled(styling.styler_abs(df_tot_sum.drop(index='Benchmark values'), model.exp_bins)), n_date)
+
+    # CAMELS Visualizations page figures, built and serialized for the latest date
+    n_institutions_total = len(panel_index.institutions)
+    df_r_date = panel_index.date_slice(df_ratings_fmt, date)
+    df_v_date = panel_index.date_slice(df_final_fmt, date)
+    camels_vars = list(df_final.columns[1:])
+    stage('ratings_final_figure', lambda: charts.ratings_final_figure(df_r_date, n_institutions_total, rating_thresholds).to_json(), n_date)
+    stage('variables_final_figures', lambda: [
+        charts.variables_final_figure(df_r_date, df_v_date, n_institutions_total, model.exp_bins, var).to_json()
+        for var in camels_vars
+    ], n_date * len(camels_vars))
+    selected = panel_index.institutions[0:2]
+    stage('time_series_figure', lambda: charts.time_series_figure(
+        df_final_fmt.iloc[panel_index.for_institutions(selected)], camels_vars[1]).to_json())
+
+    # Weight Sensitivity page, latest date
+    stage('weight_sensitivity', lambda: weight_sensitivity(df_r_date, model.camels_weights, n_samples=2000, seed=0), n_date)
+
+    # Rating Migration page, matrices of every date pair at every horizon
+    stage('rating_migrations', lambda: RatingMigrations(df_ratings_fmt))
+
+    return {
+        'institutions': n_institutions,
+        'dates': n_dates,
+        'null_rate': null_rate,
+        'rows': n,
+        'stages': stages,
+        'total_seconds_min': sum(s['seconds_min'] for s in stages.values()),
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CAMELS pipeline on synthetic panels.')
+    parser.add_argument('--institutions', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--dates', type=int, nargs='+', default=[8])
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-excel', action='store_true', help='skip the (slow) xlsx write and load stage')
+    parser.add_argument('--output', help='JSON output file, defaults to stdout')
+    args = parser.parse_args(argv)
+
+    results = {'environment': environment(), 'runs': []}
+    for n_dates in args.dates:
+        for n_institutions in args.institutions:
+            print(f'Benchmarking {n_institutions} institutions x {n_dates} dates ...', file=sys.stderr)
+            results['runs'].append(bench_panel(n_institutions, n_dates, args.null_rate, args.repeat,
+                                               excel=not args.skip_excel, seed=args.seed))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
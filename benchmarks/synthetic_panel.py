@@ -0,0 +1,68 @@
+# Synthetic Institution_Data panels with the full column set df_var needs
+import numpy as np
+import pandas as pd
+
+from camels.input_loaders import numeric_columns
+
+def synthetic_panel(n_institutions=100, n_dates=8, null_rate=0.0, freq='YE', end='2023-12-31', seed=0):
+    # Balanced panel (institutions x dates), lagged Total Assets consistent with the asset history
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=end, periods=n_dates, freq=freq)
+    n = n_institutions * n_dates
+    shape = (n_institutions, n_dates)
+
+    def draw(low, high):
+        return rng.uniform(low, high, shape).ravel()
+
+    # Total Assets path per institution, three extra periods for the lag columns
+    size = rng.lognormal(mean=13, sigma=1.5, size=(n_institutions, 1))
+    growth = rng.normal(0.03, 0.05, (n_institutions, n_dates + 3))
+    assets_path = size * np.cumprod(1 + growth, axis=1)
+    total_assets = assets_path[:, 3:].ravel()
+
+    total_equity = total_assets * draw(0.05, 0.2)
+    rwa = total_assets * draw(0.35, 0.65)
+    gross_loans = total_assets * draw(0.5, 0.85)
+    stage_3 = gross_loans * draw(0.0, 0.18)
+    stage_2 = gross_loans * draw(0.03, 0.15)
+    interest_income = total_assets * draw(0.02, 0.05)
+    interest_expenses = interest_income * draw(0.03, 0.3)
+    non_interest_income = interest_income * draw(0.05, 0.6)
+    net_operating_income = interest_income - interest_expenses + non_interest_income
+    total_liabilities = total_assets - total_equity
+
+    df = pd.DataFrame({
+        'Date': np.tile(dates.values, n_institutions),
+        'Institution Name': np.repeat([f'Bank {i + 1}' for i in range(n_institutions)], n_dates),
+        'Tier 1 Capital': rwa * draw(0.05, 0.25),
+        'RWA': rwa,
+        'Total Liabilities': total_liabilities,
+        'Total Equity': total_equity,
+        'Stage 1 Exposure': gross_loans - stage_2 - stage_3,
+        'Stage 2 Exposure': stage_2,
+        'Stage 3 Exposure': stage_3,
+        'Total Gross Loans': gross_loans,
+        'Total Provisions': gross_loans * draw(0.01, 0.1),
+        'Total Assets': total_assets,
+        'Total Assets (t-1)': assets_path[:, 2:-1].ravel(),
+        'Total Assets (t-2)': assets_path[:, 1:-2].ravel(),
+        'Total Assets (t-3)': assets_path[:, :-3].ravel(),
+        'Net Income': total_assets * rng.normal(0.008, 0.006, n),
+        'Net Operating Income': net_operating_income,
+        'Non Interest Income': non_interest_income,
+        'Interest Income': interest_income,
+        'Interest Expenses': interest_expenses,
+        'Expenses': net_operating_income * draw(0.3, 1.2),
+        'Liquid Assets': total_assets * draw(0.05, 0.3),
+        'Current Liabilities': total_liabilities * draw(0.4, 0.9),
+        'Liquidity Coverage Ratio (LCR)': draw(0.8, 2.5),
+    })
+
+    # Missing values spread uniformly over the numeric block
+    if null_rate > 0:
+        values = df[numeric_columns].to_numpy()
+        values[rng.random(values.shape) < null_rate] = np.nan
+        df[numeric_columns] = values
+
+    # Input files are ordered by date, latest first, like the example workbook
+    return df.sort_values(['Date', 'Institution Name'], ascending=[False, True], kind='stable').reset_index(drop=True)
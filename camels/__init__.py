@@ -0,0 +1,2 @@
+# Helpers shared by the dashboard pages, the batch scoring CLI and the benchmarks
+# (camels.perf and the chart rendering of camels.figure_cache are the only Streamlit dependent parts)
@@ -0,0 +1,182 @@
+# Headless batch scoring of CAMELS input files
+#
+# Usage:
+#   python -m camels.batch_scoring INPUT_DIR OUTPUT_FILE [--workers N] [--market-scope all|file]
+#                                  [--binning expert|quantile|kmeans-1d]
+#
+# Every supported file in INPUT_DIR (xlsx, csv, parquet, arrow) is scored in a process pool with the same
+# feature extraction and rating logic as the dashboard. Results are streamed to OUTPUT_FILE as they complete,
+# Parquet or CSV depending on the extension (or --format). Data-driven binning methods derive the thresholds
+# from quantile sketches of all files, computed in the pool and merged before scoring.
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pa_parquet
+
+from camels import binning, model
+from camels.input_loaders import load_upload, upload_types
+
+def list_input_files(input_dir):
+    files = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        extension = os.path.splitext(name)[1].lower().lstrip('.')
+        if os.path.isfile(path) and extension in upload_types:
+            files.append(path)
+    return files
+
+def read_input_file(path, use_cache):
+    with open(path, 'rb') as f:
+        data = f.read()
+    df, _ = load_upload(data, os.path.basename(path), use_cache=use_cache)
+    return df
+
+def market_totals_file(path, use_cache):
+    # First pass for market scope 'all', per date sums of provisions and gross loans
+    df = read_input_file(path, use_cache)
+    return df[['Date', 'Total Provisions', 'Total Gross Loans']].groupby(by='Date', sort=False).sum()
+
+def sketch_file(path, df_market, use_cache):
+    # Extra pass for data-driven binning, quantile sketches of the CAMELS variables of one file
+    df = read_input_file(path, use_cache)
+    return binning.sketch_variables(model.df_var(df, df_market))
+
+def score_file(path, df_market, bins_dict, use_cache):
+    df = read_input_file(path, use_cache)
+    df_final = model.df_var(df, df_market)
+    df_ratings = model.create_df_ratings(df_final, bins_dict, model.camels_weights)
+    df_ratings = df_ratings.reset_index()
+    df_ratings.insert(0, 'Source File', os.path.basename(path))
+    return df_ratings
+
+class ResultWriter:
+    # Appends scored frames to a single Parquet (one row group per file) or CSV output
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self._parquet_writer = None
+        self._csv_header = True
+
+    def write(self, df):
+        if self.output_format == 'parquet':
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pa_parquet.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table.cast(self._parquet_writer.schema))
+        else:
+            df.to_csv(self.path, mode='w' if self._csv_header else 'a', header=self._csv_header, index=False)
+            self._csv_header = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+def run(files, output_path, output_format='parquet', workers=None, market_scope='all', binning_method='expert',
+        use_cache=True, log=sys.stderr):
+    start = time.perf_counter()
+    rows = 0
+    scored = 0
+    failed = []
+    writer = ResultWriter(output_path, output_format)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Market Loan Loss Rate across all files, otherwise every file is its own market
+        df_market = None
+        if market_scope == 'all':
+            totals = {}
+            futures = {pool.submit(market_totals_file, path, use_cache): path for path in files}
+            for future in as_completed(futures):
+                try:
+                    totals[futures[future]] = future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f'FAILED {futures[future]}: {e}', file=log)
+            if not totals:
+                return {'files': 0, 'failed': len(failed), 'rows': 0, 'seconds': time.perf_counter() - start}
+            # Sum in input file order so the market rate does not depend on completion order
+            df_market = pd.concat([totals[path] for path in files if path in totals]).groupby(level=0, sort=False).sum()
+            df_market['Market Loan Loss Rate'] = df_market['Total Provisions']/df_market['Total Gross Loans']
+            df_market = df_market.reset_index()
+            files = [path for path in files if path not in failed]
+
+        # Thresholds of data-driven binning methods from the merged sketches of all files
+        bins_dict = {cvar: [binning_method] + bins[1:] for cvar, bins in model.bins_dict.items()}
+        if binning_method != 'expert':
+            sketches = {}
+            futures = {pool.submit(sketch_file, path, df_market, use_cache): path for path in files}
+            for future in as_completed(futures):
+                try:
+                    sketches[futures[future]] = future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f'FAILED {futures[future]}: {e}', file=log)
+            files = [path for path in files if path in sketches]
+            if not files:
+                return {'files': 0, 'failed': len(failed), 'rows': 0, 'seconds': time.perf_counter() - start}
+            merged = sketches[files[0]]
+            for path in files[1:]:
+                for cvar, sketch in sketches[path].items():
+                    merged[cvar].merge(sketch)
+            derived = binning.derive_bins(bins_dict, merged)
+            for cvar, bins in derived.items():
+                fallback = cvar in binning.fallback_variables(bins_dict, derived)
+                method = 'expert (derived thresholds not strictly increasing)' if fallback else binning_method
+                print(f'{cvar}: {method} thresholds {bins[2:]}', file=log)
+            bins_dict = derived
+
+        futures = {pool.submit(score_file, path, df_market, bins_dict, use_cache): path for path in files}
+        try:
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    df_ratings = future.result()
+                except Exception as e:
+                    failed.append(path)
+                    print(f'FAILED {path}: {e}', file=log)
+                    continue
+                writer.write(df_ratings)
+                rows += len(df_ratings)
+                scored += 1
+                print(f'[{scored}/{len(files)}] {os.path.basename(path)}: {len(df_ratings)} rows', file=log)
+        finally:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    return {'files': scored, 'failed': len(failed), 'rows': rows, 'seconds': seconds}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a directory of CAMELS input files without the dashboard.')
+    parser.add_argument('input_dir', help='directory with .xlsx, .csv, .parquet or Arrow IPC input files')
+    parser.add_argument('output', help='output file, .parquet or .csv')
+    parser.add_argument('--format', choices=['parquet', 'csv'], help='output format, defaults to the output extension')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: CPU count)')
+    parser.add_argument('--market-scope', choices=['all', 'file'], default='all',
+                        help='compute the Market Loan Loss Rate across all input files or per file (default: all)')
+    parser.add_argument('--binning', choices=binning.binning_methods, default='expert',
+                        help='binning method of all variables, data-driven methods derive thresholds from all input files (default: expert)')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the on-disk upload cache for xlsx files')
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'parquet')
+    files = list_input_files(args.input_dir)
+    if not files:
+        parser.error(f'no input files found in {args.input_dir}')
+
+    stats = run(files, args.output, output_format=output_format, workers=args.workers,
+                market_scope=args.market_scope, binning_method=args.binning, use_cache=not args.no_cache)
+
+    seconds = max(stats['seconds'], 1e-9)
+    print(
+        f"Scored {stats['files']} files ({stats['failed']} failed), {stats['rows']} rows in {seconds:.2f} s: "
+        f"{stats['rows']/seconds:,.0f} rows/s, {stats['files']/seconds:,.2f} files/s"
+    )
+    return 1 if stats['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Data-driven binning methods, thresholds derived from the empirical distribution of every CAMELS variable
+#
+# 'quantile'   thresholds at the 20/40/60/80 % quantiles, every rating gets a fifth of the panel
+# 'kmeans-1d'  thresholds halfway between the 5 sorted centers of a one dimensional k-means
+#
+# Distributions are summarized in a mergeable quantile sketch, so thresholds of large or multi-file histories
+# can be computed chunk by chunk (or in parallel) and merged, without holding every value in memory.
+import numpy as np
+
+binning_methods = ['expert', 'quantile', 'kmeans-1d']
+quantile_levels = [0.2, 0.4, 0.6, 0.8]
+
+class QuantileSketch:
+    # Relative-error quantile sketch with logarithmic buckets (DDSketch), merging adds bucket counts.
+    # Every estimated quantile is within relative_accuracy of the value of that rank.
+
+    def __init__(self, relative_accuracy=0.001):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_indexable = np.finfo(float).tiny * self.gamma # smaller magnitudes are counted as zero
+        self.positive = {} # bucket index -> count
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min_value = np.inf
+        self.max_value = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[np.isfinite(values)] # missing data and divisions by zero are not part of the distribution
+        if not len(values):
+            return self
+        for store, magnitudes in ((self.positive, values[values > self.min_indexable]),
+                                  (self.negative, -values[values < -self.min_indexable])):
+            keys, counts = np.unique(np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + count
+        self.zero_count += int((np.abs(values) <= self.min_indexable).sum())
+        self.count += len(values)
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Only sketches with the same relative accuracy can be merged.')
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        return self
+
+    def bins(self):
+        # Ascending representative values and counts of the non-empty buckets
+        negative_keys = np.array(sorted(self.negative, reverse=True), dtype=np.int64)
+        positive_keys = np.array(sorted(self.positive), dtype=np.int64)
+        scale = 2 / (self.gamma + 1)
+        values = np.concatenate([-scale * self.gamma ** negative_keys.astype(float), [0.0],
+                                 scale * self.gamma ** positive_keys.astype(float)])
+        counts = np.concatenate([[self.negative[key] for key in negative_keys.tolist()], [self.zero_count],
+                                 [self.positive[key] for key in positive_keys.tolist()]]).astype(np.int64)
+        keep = counts > 0
+        return np.clip(values[keep], self.min_value, self.max_value), counts[keep]
+
+    def quantiles(self, levels):
+        if not self.count:
+            return np.full(len(levels), np.nan)
+        values, counts = self.bins()
+        ranks = np.asarray(levels, dtype=float) * (self.count - 1)
+        return values[np.searchsorted(np.cumsum(counts), ranks, side='right')]
+
+def kmeans_1d_thresholds(values, weights, n_clusters=5, max_iter=100):
+    # Weighted Lloyd iterations on sorted values, centers start at the weighted quantile midpoints
+    cumulative = np.cumsum(weights) / np.sum(weights)
+    centers = values[np.searchsorted(cumulative, (np.arange(n_clusters) + 0.5) / n_clusters)]
+    for _ in range(max_iter):
+        boundaries = (centers[1:] + centers[:-1]) / 2
+        cluster = np.searchsorted(boundaries, values, side='right')
+        total = np.bincount(cluster, weights=weights, minlength=n_clusters)
+        weighted = np.bincount(cluster, weights=weights * values, minlength=n_clusters)
+        new_centers = np.where(total > 0, weighted / np.maximum(total, 1e-300), centers) # empty clusters keep their center
+        if np.allclose(new_centers, centers, rtol=0, atol=1e-12):
+            break
+        centers = new_centers
+    return (centers[1:] + centers[:-1]) / 2
+
+def sketch_thresholds(sketch, method):
+    if method == 'quantile':
+        return sketch.quantiles(quantile_levels)
+    if method == 'kmeans-1d':
+        if not sketch.count:
+            return np.full(4, np.nan)
+        return kmeans_1d_thresholds(*sketch.bins())
+    raise ValueError(f'Unknown binning method: {method}')
+
+def sketch_variables(df_final, camels_vars=None, relative_accuracy=0.001):
+    # One sketch per CAMELS variable, merge the results of several chunks or files with QuantileSketch.merge
+    camels_vars = df_final.columns[1:] if camels_vars is None else camels_vars
+    return {cvar: QuantileSketch(relative_accuracy).update(df_final[cvar].to_numpy(dtype=float)) for cvar in camels_vars}
+
+def increasing(thresholds):
+    # Same rule calibration_from_table applies to typed thresholds, no empty bins
+    thresholds = np.asarray(thresholds, dtype=float)
+    return bool(np.isfinite(thresholds).all() and (np.diff(thresholds) > 0).all())
+
+def derive_bins(bins_dict, sketches):
+    # Copy of bins Dict with data-driven thresholds for every variable whose Binning Method is not 'expert'.
+    # Thresholds that are not strictly increasing (e.g. a variable with mostly one value) would leave bins empty,
+    # such variables keep the expert thresholds of bins Dict and become 'expert' (see fallback_variables)
+    derived = {}
+    for cvar, bins in bins_dict.items():
+        thresholds = [] if bins[0] == 'expert' else [float(t) for t in sketch_thresholds(sketches[cvar], bins[0])]
+        if bins[0] == 'expert' or not increasing(thresholds):
+            derived[cvar] = ['expert'] + list(bins[1:])
+        else:
+            derived[cvar] = list(bins[:2]) + thresholds
+    return derived
+
+def data_driven_variables(bins_dict):
+    return [cvar for cvar, bins in bins_dict.items() if bins[0] != 'expert']
+
+def fallback_variables(bins_dict, derived):
+    # Data-driven variables of bins Dict that kept their expert thresholds in derive_bins
+    return [cvar for cvar in data_driven_variables(bins_dict) if derived[cvar][0] == 'expert']
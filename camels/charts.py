@@ -0,0 +1,115 @@
+# Plotly figure builders of the CAMELS Visualizations page
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+final_rating_colors = {
+    'A+': '#175C2C', 'A-': '#2C8646',
+    'B+': '#86DB4F', 'B-': '#C4FC9F',
+    'C+': '#FFECBD', 'C-': '#FFC83D',
+    'D+': '#FFA929', 'D-': '#FD6412',
+    'E+': '#E0301E', 'E-': '#AA2417'}
+
+def auto_adjust_height(ylabel_count, font_size=14, multiplier=2.0, padding=50):
+    height = padding + (np.multiply(ylabel_count, font_size) * multiplier)
+    return height
+
+def ratings_final_figure(filter_df, n_institutions, range_score):
+    filter_df = filter_df[['Date', 'Composite Final Score', 'Final Rating']].reset_index().sort_values('Composite Final Score', ascending=True)
+    fig = px.bar(data_frame=filter_df, x='Composite Final Score', y='Institution Name',
+                 color='Final Rating', text='Final Rating', 
+                 color_discrete_map=final_rating_colors,
+                 orientation='h')
+    fig.update_layout(title='Financial Institutions Final Ratings',
+                      height=int(auto_adjust_height(n_institutions)),
+                      xaxis=dict(showgrid=True, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14), tickmode='linear', dtick=0.5),
+                      yaxis=dict(showgrid=True, categoryorder="total descending", title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      legend=dict(title='Final Rating', font=dict(size=14), title_font=dict(size=14), traceorder='normal'),
+                      hovermode='closest',
+                      font=dict(family='Arial'),
+                      title_font=dict(family='Arial', size=18))
+    fig.update_traces(textangle=0, textposition="outside")
+    fig.add_vline(x=range_score['1st'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score['2nd'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score['3rd'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score['4th'], line_width=2, line_dash="dot", opacity=0.6)
+    
+    return fig
+
+def variables_final_figure(df_r_filter, df_v_filter, n_institutions, range_score, var):
+    df_r_filter = df_r_filter[['Date', var]]
+    df_v_filter = df_v_filter[['Date', var]]
+    filter_df = pd.merge(df_r_filter, df_v_filter, how='inner', left_index=True, right_index=True).reset_index()
+    # int64 subratings, compact int8 ones would sort ties in a different order
+    filter_df = filter_df.astype({filter_df.columns[2]: 'int64'}).sort_values(filter_df.columns[2], ascending=True)
+    filter_df[var+' Rating Adjusted'] = filter_df[var+'_x'].replace([1, 2, 3, 4, 5], ['A', 'B', 'C', 'D', 'E'])
+    category_order = 'total ascending' if range_score.loc[var, 'Reverse'] else 'total descending'
+    filter_df.rename(columns={(var+'_y'):var}, inplace=True)
+    filter_df[var] = round(filter_df[var].astype(float), 3)
+    
+    fig = px.bar(data_frame=filter_df, x=var, y='Institution Name',
+                 color=var+' Rating Adjusted', text=var+' Rating Adjusted', 
+                 color_discrete_map={
+                    'A': '#175C2C',
+                    'B': '#86DB4F',
+                    'C': '#FFECBD',
+                    'D': '#FFA929',
+                    'E': '#E0301E'},
+                 orientation='h')
+    fig.update_layout(title=var + ' Ratings',
+                      height=int(auto_adjust_height(n_institutions)),
+                      xaxis_title=var,
+                      xaxis=dict(showgrid=True, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      yaxis=dict(showgrid=True, categoryorder=category_order, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      legend_title_text=var+' Rating',
+                      legend=dict(font=dict(size=14), title_font=dict(size=14), traceorder='normal', orientation='h',
+                                  yanchor='bottom', yref='container', xanchor='right', xref='paper'),
+                      hovermode='closest',
+                      font=dict(family='Arial'),
+                      title_font=dict(family='Arial', size=18))
+    fig.update_traces(textangle=0, textposition="outside")
+    fig.add_vline(x=range_score.loc[var, '1st_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score.loc[var, '2nd_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score.loc[var, '3rd_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
+    fig.add_vline(x=range_score.loc[var, '4th_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
+    
+    return fig
+
+def grade_distribution_figure(df_sensitivity, grades):
+    # Stacked grade probabilities per institution, least stable ratings on top
+    filter_df = df_sensitivity.reset_index().sort_values('Current Rating Probability', ascending=False)
+    filter_df = filter_df.melt(id_vars=['Institution Name', 'Final Rating'], value_vars=grades,
+                               var_name='Rating', value_name='Probability')
+    fig = px.bar(data_frame=filter_df, x='Probability', y='Institution Name',
+                 color='Rating', color_discrete_map=final_rating_colors,
+                 hover_data=['Final Rating'], orientation='h')
+    fig.update_layout(title='Final Rating Distribution under Weight Perturbations',
+                      height=int(auto_adjust_height(df_sensitivity.shape[0])),
+                      xaxis=dict(showgrid=True, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14), tickformat='.0%', range=[0, 1]),
+                      yaxis=dict(showgrid=True, categoryorder='array', categoryarray=filter_df['Institution Name'].unique(),
+                                 title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      legend=dict(title='Rating', font=dict(size=14), title_font=dict(size=14), traceorder='normal'),
+                      hovermode='closest',
+                      font=dict(family='Arial'),
+                      title_font=dict(family='Arial', size=18))
+    return fig
+
+def migration_heatmap_figure(df_migration, probabilities=True, title='Rating Migration Matrix'):
+    # From grade (rows) x to grade (columns) heatmap, unchanged grades on the diagonal
+    fig = px.imshow(df_migration, text_auto='.1%' if probabilities else 'd', aspect='auto',
+                    color_continuous_scale=['#FFFFFF', '#86DB4F', '#175C2C'],
+                    zmin=0, zmax=1 if probabilities else None)
+    fig.update_layout(title=title,
+                      height=int(auto_adjust_height(len(df_migration), multiplier=3.0, padding=150)),
+                      xaxis=dict(title='To Rating', side='top', title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      yaxis=dict(title='From Rating', title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
+                      coloraxis_colorbar=dict(title='Probability' if probabilities else 'Institutions', tickformat='.0%' if probabilities else None),
+                      font=dict(family='Arial'),
+                      title_font=dict(family='Arial', size=18))
+    return fig
+
+def time_series_figure(df_inst, var):
+    fig = px.line(round(df_inst.reset_index().sort_values('Date').astype({var: float}), 3), x='Date', y=var, 
+                  color='Institution Name', text=var)
+    fig.update_traces(textposition="bottom right")
+    return fig
@@ -0,0 +1,83 @@
+# Compact storage of the session frames (upload, camels_input, camels_variables, ratings)
+#
+# Repeated labels (institution names, dates, letter grades) become categoricals, i.e. integer codes into one list
+# of labels, integer columns the smallest integer type (int8 subratings) and ratio columns float32 when every
+# value keeps its displayed decimals. Unchanged columns share the buffers of the original frame instead of a copy.
+import numpy as np
+import pandas as pd
+
+def categorical(values):
+    # Codes into the distinct values in order of appearance, None when less than half of the values repeat
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    if len(uniques) > len(values) // 2:
+        return None
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+def compact_frame(df, panel_index=None, float32_decimals=None):
+    # Shallow copy, only the converted columns get new buffers
+    # With a PanelIndex of the same rows, dates and institution names reuse its shared categoricals
+    shared = {} if panel_index is None else {'Date': panel_index.date_categorical, 'Institution Name': panel_index.institution_categorical}
+    compact = df.copy(deep=False)
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            labels = shared[col]() if col in shared else categorical(values.to_numpy())
+            if labels is not None:
+                compact[col] = labels
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            compact[col] = pd.to_numeric(values.to_numpy(), downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype) and values.dtype != np.float32 and float32_decimals is not None:
+            values32 = values.to_numpy(dtype=np.float32)
+            with np.errstate(invalid='ignore', over='ignore'):
+                if np.array_equal(np.round(values32.astype(float), float32_decimals),
+                                  np.round(values.to_numpy(dtype=float), float32_decimals), equal_nan=True):
+                    compact[col] = values32
+    # Index last, arrays assigned to the columns above are not aligned to it
+    if df.index.dtype == object:
+        labels = shared[df.index.name]() if df.index.name in shared else categorical(df.index.to_numpy())
+        if labels is not None:
+            compact.index = pd.CategoricalIndex(labels, name=df.index.name)
+    return compact
+
+def expanded_frame(df):
+    # Categorical columns and index back to plain labels, frames derived from it match those of the original frame
+    # (downcast integer and float32 columns are kept, their values are unchanged)
+    categorical_columns = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical_columns and not isinstance(df.index, pd.CategoricalIndex):
+        return df
+    expanded = df.copy(deep=False)
+    for col in categorical_columns:
+        expanded[col] = df[col].to_numpy()
+    if isinstance(df.index, pd.CategoricalIndex):
+        expanded.index = pd.Index(df.index.to_numpy(), name=df.index.name)
+    return expanded
+
+def _buffers(values, arrays):
+    # (address, bytes) of the arrays behind an index or column, categoricals count codes and categories
+    # arrays keeps every array alive, so a temporary array cannot reuse the address of another one
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categorical = values.array
+        arrays.append(categorical.codes)
+        return [(categorical.codes.__array_interface__['data'][0], categorical.codes.nbytes)] + _buffers(categorical.categories, arrays)
+    array = values.to_numpy()
+    arrays.append(array)
+    nbytes = values.memory_usage(deep=True) if isinstance(values, pd.Index) else values.memory_usage(index=False, deep=True)
+    return [(array.__array_interface__['data'][0], nbytes)]
+
+def frame_bytes(*frames):
+    # Memory held by the frames, buffers shared between frames (or columns) are counted once
+    buffers, arrays = {}, []
+    for df in frames:
+        if df is None:
+            continue
+        buffers.update(_buffers(df.index, arrays))
+        for j in range(df.shape[1]):
+            buffers.update(_buffers(df.iloc[:, j], arrays))
+    return sum(buffers.values())
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n) < 1024:
+            return f'{n:,.1f} {unit}'
+        n /= 1024
+    return f'{n:,.1f} GB'
@@ -0,0 +1,145 @@
+# Process-wide store of uploaded datasets and their derived frames, shared by all sessions of the server
+#
+# Entries are keyed by (dataset, name), the dataset being the content hash of the uploaded file, so sessions that
+# upload the same workbook share one parsed input and one set of derived frames (CAMELS variables, subratings, panel
+# index, market tables, ...). Least recently used entries are evicted once the stored total exceeds the memory budget,
+# and a dataset is dropped as soon as no session holds it any more, entries of other datasets are never touched.
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from camels.compact import frame_bytes
+
+default_max_bytes = int(os.environ.get('CAMELS_DATASET_STORE_MB', 2048)) * 2**20
+
+def sizeof(value, seen=None):
+    # Approximate memory held by a value, frames and arrays by their buffers, containers and objects recursively
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return frame_bytes(value)
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(v, seen) for v in value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + sizeof(vars(value), seen)
+    return sys.getsizeof(value)
+
+class DatasetStore:
+    # Thread safe LRU of (dataset, name) -> value, bounded by the total size of the values when they were stored
+
+    def __init__(self, max_bytes=default_max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # (dataset, name) -> (value, bytes), LRU order
+        self._bytes = 0
+        self._holders = {} # dataset -> ids of the sessions showing it
+        self._building = {} # (dataset, name) -> lock, concurrent sessions build an entry once
+        self._lock = threading.Lock()
+
+    def get(self, dataset, name, default=None):
+        with self._lock:
+            entry = self._entries.get((dataset, name))
+            if entry is None:
+                return default
+            self._entries.move_to_end((dataset, name))
+            return entry[0]
+
+    def put(self, dataset, name, value):
+        # Values larger than the whole budget are returned without being stored
+        nbytes = sizeof(value)
+        with self._lock:
+            self._discard((dataset, name))
+            if nbytes > self.max_bytes:
+                return value
+            self._entries[(dataset, name)] = value, nbytes
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+        return value
+
+    def get_or_build(self, dataset, name, build):
+        # build() only runs on a miss, sessions asking for the same entry at once wait for one build
+        value = self.get(dataset, name)
+        if value is not None:
+            return value
+        with self._lock:
+            building = self._building.setdefault((dataset, name), threading.Lock())
+        with building:
+            value = self.get(dataset, name)
+            if value is None:
+                value = self.put(dataset, name, build())
+        with self._lock:
+            self._building.pop((dataset, name), None)
+        return value
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def invalidate(self, dataset):
+        # Drops every entry of one dataset
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == dataset]:
+                self._discard(key)
+
+    def hold(self, dataset, session):
+        with self._lock:
+            self._holders.setdefault(dataset, set()).add(session)
+
+    def release(self, dataset, session):
+        # Returns True when the session was the last one holding the dataset and its entries were dropped
+        with self._lock:
+            holders = self._holders.get(dataset, set())
+            holders.discard(session)
+            if holders:
+                return False
+            self._holders.pop(dataset, None)
+        self.invalidate(dataset)
+        return True
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def datasets(self):
+        with self._lock:
+            return list(dict.fromkeys(dataset for dataset, _ in self._entries))
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_store():
+    # One store per server process
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DatasetStore()
+        return _shared
+
+def session_entry(name, build):
+    # Entry of the session's dataset, built by the first session that needs it, hit or miss shows in the perf panel
+    import streamlit as st
+    from camels import perf
+    store = shared_store()
+    dataset = st.session_state.get('dataset')
+    with perf.cached(name if isinstance(name, str) else name[0]) as call:
+        call['hit'] = (dataset, name) in store
+        return store.get_or_build(dataset, name, build)
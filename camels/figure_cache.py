@@ -0,0 +1,117 @@
+# Process-wide cache of serialized Plotly figures
+#
+# Figures are stored as Plotly JSON keyed by the ratings key (dataset content hash and calibration) plus what the
+# figure shows (date, variable, labels), so a previously seen chart skips the pandas and Plotly Express work of
+# building it. A hit still costs st.plotly_chart's copy and re-serialization of the figure (about 9 ms for a
+# 120 KB chart), the stored JSON is already validated and is not validated again.
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+default_max_entries = int(os.environ.get('CAMELS_FIGURE_CACHE_ENTRIES', 512))
+default_max_bytes = int(os.environ.get('CAMELS_FIGURE_CACHE_MB', 256)) * 2**20
+
+def figure_json(fig):
+    # Same serialization as st.plotly_chart
+    return pio.to_json(fig, validate=False)
+
+class FigureCache:
+    # Bounded LRU (entries and total JSON size), shared by all sessions of the server
+
+    def __init__(self, max_entries=default_max_entries, max_bytes=default_max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._figures = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            spec = self._figures.get(key)
+            if spec is not None:
+                self._figures.move_to_end(key)
+            return spec
+
+    def put(self, key, spec):
+        with self._lock:
+            if key in self._figures:
+                self._bytes -= len(self._figures.pop(key))
+            self._figures[key] = spec
+            self._bytes += len(spec)
+            while self._figures and (len(self._figures) > self.max_entries or self._bytes > self.max_bytes):
+                self._bytes -= len(self._figures.popitem(last=False)[1])
+        return spec
+
+    def get_or_build(self, key, build):
+        # Returns (spec, hit), build() returns a Plotly figure and only runs on a miss
+        spec = self.get(key)
+        if spec is not None:
+            return spec, True
+        return self.put(key, figure_json(build())), False
+
+    def invalidate(self, dataset_key):
+        # Drops the figures of one dataset, the ratings key in every figure key starts with its dataset key
+        with self._lock:
+            for key in [key for key in self._figures if str(key[1]).startswith(dataset_key)]:
+                self._bytes -= len(self._figures.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._figures)
+
+    def __contains__(self, key):
+        return key in self._figures
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_figure_cache():
+    # One figure cache per server process, the upload page invalidates the figures of a released dataset
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FigureCache()
+        return _shared
+
+class FigurePrefetcher:
+    # Builds figures into a FigureCache on a background thread, before the user opens them
+
+    def __init__(self, cache, max_workers=1):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='figure-prefetch')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, build):
+        with self._lock:
+            if key in self._pending or key in self.cache:
+                return False
+            self._pending.add(key)
+        self._executor.submit(self._build, key, build)
+        return True
+
+    def _build(self, key, build):
+        try:
+            self.cache.put(key, figure_json(build()))
+        except Exception:
+            pass # a failed prefetch is built again on demand
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+def plotly_json_chart(spec, use_container_width=True):
+    # st.plotly_chart of a cached figure, a Figure without validation (a plain dict is validated property by property
+    # by st.plotly_chart, about three times the cost of the whole hit)
+    import streamlit as st
+    from camels import perf
+    perf.payload('plotly_chart', len(spec))
+    return st.plotly_chart(go.Figure(json.loads(spec), _validate=False), use_container_width=use_container_width)
@@ -0,0 +1,97 @@
+# Incremental re-rating, only reporting dates that are new or changed are recomputed
+#
+# Market loss rate, CAMELS variables and ratings of a date depend only on the input rows of that date,
+# so results are persisted per date keyed by a fingerprint of those rows and merged back into the full history.
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from camels import binning, model
+from camels.upload_cache import UploadCache
+
+default_history_dir = os.environ.get(
+    'CAMELS_HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.rating_history')
+)
+
+def date_fingerprints(df):
+    # Fingerprint of every date's rows (in row order), unchanged dates keep their fingerprint between uploads
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    columns_key = '|'.join(map(str, df.columns)).encode()
+    fingerprints = {}
+    for date, positions in df.groupby('Date', sort=False).indices.items():
+        digest = hashlib.blake2b(row_hashes[positions].tobytes(), digest_size=16)
+        digest.update(columns_key)
+        fingerprints[date] = digest.hexdigest()
+    return fingerprints
+
+def model_key(bins_dict, weights):
+    # Ratings also depend on thresholds and weights
+    payload = json.dumps({'bins': bins_dict, 'weights': weights.iloc[0].to_dict()}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+class IncrementalRater:
+
+    def __init__(self, history_dir=default_history_dir, store=None):
+        self.store = store if store is not None else UploadCache(history_dir)
+
+    def _get(self, key):
+        df = self.store.get(key)
+        return None if df is None else df.set_index('Institution Name')
+
+    def _put(self, key, df):
+        self.store.put(key, df.reset_index())
+
+    def score(self, df, bins_dict, weights=None):
+        weights = model.camels_weights if weights is None else weights
+        fingerprints = date_fingerprints(df)
+        positions = df.groupby('Date', sort=False).indices
+
+        variables = {date: self._get(f'var-{fp}') for date, fp in fingerprints.items()}
+        variable_delta = [date for date in fingerprints if variables[date] is None]
+
+        # Compute market loss rates and ratios only for the delta dates, in one pass
+        if variable_delta:
+            df_delta = df.iloc[np.sort(np.concatenate([positions[date] for date in variable_delta]))]
+            df_final_delta = model.df_var(df_delta)
+            delta_groups = df_delta.groupby('Date', sort=False).indices
+            for date in variable_delta:
+                variables[date] = df_final_delta.iloc[delta_groups[date]]
+                self._put(f'var-{fingerprints[date]}', variables[date])
+
+        # Data-driven thresholds depend on the whole panel, the derived values are part of the model key
+        if binning.data_driven_variables(bins_dict):
+            bins_dict = binning.derive_bins(bins_dict, binning.sketch_variables(pd.concat(variables.values())))
+
+        # Ratios are independent of thresholds and weights, a model change only re-rates
+        mkey = model_key(bins_dict, weights)
+        ratings = {date: self._get(f'rat-{fp}-{mkey}') for date, fp in fingerprints.items()}
+        delta_dates = [date for date in fingerprints if ratings[date] is None]
+
+        # Ratings for the delta dates, in one pass
+        if delta_dates:
+            df_final_delta = pd.concat([variables[date] for date in delta_dates])
+            df_ratings_delta = model.create_df_ratings(df_final_delta, bins_dict, weights)
+            start = 0
+            for date in delta_dates:
+                ratings[date] = df_ratings_delta.iloc[start:start + len(variables[date])]
+                start += len(variables[date])
+                self._put(f'rat-{fingerprints[date]}-{mkey}', ratings[date])
+
+        # Merge into the full history, restoring the input row order
+        dates = list(fingerprints)
+        order = np.argsort(np.concatenate([positions[date] for date in dates]), kind='stable')
+        df_final = pd.concat([variables[date] for date in dates]).iloc[order]
+        df_ratings = pd.concat([ratings[date] for date in dates]).iloc[order]
+
+        stats = {
+            'dates': len(dates),
+            'computed_dates': len(delta_dates),
+            'reused_dates': len(dates) - len(delta_dates),
+            'computed_rows': int(sum(len(positions[date]) for date in delta_dates)),
+            'recomputed_ratio_dates': len(variable_delta),
+        }
+        return df_final, df_ratings, stats
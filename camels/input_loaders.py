@@ -0,0 +1,82 @@
+# Format specific loaders for the CAMELS input data upload
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pa_parquet
+
+from camels.model import derive_lagged_assets, lag_columns
+from camels.upload_cache import read_institution_data
+
+# Input schema expected by df_var
+date_column = 'Date'
+name_column = 'Institution Name'
+numeric_columns = [
+    'Tier 1 Capital', 'RWA', 'Total Liabilities', 'Total Equity',
+    'Stage 1 Exposure', 'Stage 2 Exposure', 'Stage 3 Exposure',
+    'Total Gross Loans', 'Total Provisions',
+    'Total Assets', 'Total Assets (t-1)', 'Total Assets (t-2)', 'Total Assets (t-3)',
+    'Net Income', 'Net Operating Income', 'Non Interest Income', 'Interest Income', 'Interest Expenses', 'Expenses',
+    'Liquid Assets', 'Current Liabilities', 'Liquidity Coverage Ratio (LCR)'
+]
+
+# File extensions accepted by the uploader
+upload_types = ['xlsx', 'csv', 'parquet', 'arrow', 'feather', 'ipc']
+
+def coerce_input_dtypes(df):
+    # Cast to the dtypes df_var expects, raises if a column can not be converted
+    df[date_column] = pd.to_datetime(df[date_column])
+    df[name_column] = df[name_column].astype(object)
+    for col in df.columns.intersection(numeric_columns):
+        if df[col].dtype != 'float64':
+            df[col] = df[col].astype('float64')
+    return df
+
+def prepared_input(df, derive_lags=False):
+    # Parsed input as df_var expects it, the Total Assets lags are derived from the panel history when asked for or
+    # when the input misses any of the lag columns
+    df = coerce_input_dtypes(df)
+    if derive_lags or not pd.Index(lag_columns).isin(df.columns).all():
+        df = derive_lagged_assets(df)
+    return df
+
+def read_csv(data):
+    # Multithreaded pyarrow CSV reader
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=pa_csv.ConvertOptions(column_types={name_column: pa.string()})
+    )
+    return table.to_pandas()
+
+def read_parquet(data):
+    return pa_parquet.read_table(io.BytesIO(data), use_threads=True).to_pandas()
+
+def read_arrow(data):
+    # Arrow IPC file format (also Feather v2) or the streaming format
+    try:
+        table = pa_ipc.open_file(pa.BufferReader(data)).read_all()
+    except pa.ArrowInvalid:
+        table = pa_ipc.open_stream(pa.BufferReader(data)).read_all()
+    return table.to_pandas()
+
+def load_upload(data, file_name, sheet_name='Institution_Data', use_cache=True, derive_lags=False):
+    # Returns parsed frame and a flag telling if it was served from the upload cache
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    cache_hit = False
+    if extension == 'xlsx' and use_cache:
+        df, cache_hit = read_institution_data(data, sheet_name=sheet_name)
+    elif extension == 'xlsx':
+        df = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name)
+    elif extension == 'csv':
+        df = read_csv(data)
+    elif extension == 'parquet':
+        df = read_parquet(data)
+    elif extension in ('arrow', 'feather', 'ipc'):
+        df = read_arrow(data)
+    else:
+        raise ValueError(f'Unsupported file type: {extension}')
+    return prepared_input(df, derive_lags), cache_hit
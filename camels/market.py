@@ -0,0 +1,98 @@
+# Market Analysis tables, institution ratios and the benchmark of every (reporting date, peer group) at once
+#
+# Peer groups split the institutions of each date, by asset size or by a grouping column of the input, so each one is
+# compared with its peers instead of the whole market. One grouped aggregation computes the benchmarks of all dates
+# and groups, the group codes broadcast them back to the institution rows.
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from camels.model import add_camels_ratios
+
+# Market Analysis uses the unscaled Loan Loss Provision Rate
+ratio_columns = [
+    'Tier 1 Capital Ratio', 'Debt to Equity Ratio',                        # C
+    'NPL to Total Gross Loans Ratio', 'Loan Loss Provision Rate',          # A
+    'Asset Growth Rate 3Y Average', 'Efficiency Ratio',                    # M
+    'Return on Assets (ROA)', 'Interest Expenses to Interest Income Ratio',# E
+    'Liquidity Coverage Ratio (LCR)', 'Cash Ratio',                        # L
+    'Non Interest Income Share'                                            # S
+]
+total_columns = ['Total Assets', 'Total Gross Loans']
+market_columns = total_columns + ratio_columns
+relative_columns = [col + ' Market Share' for col in total_columns] + [col + ' Difference' for col in ratio_columns]
+
+# Peer groupings besides the input columns, the whole market is a single group
+whole_market = 'Whole market'
+asset_size = 'Asset size'
+asset_size_labels = ['Small', 'Medium', 'Large', 'Unknown size']
+not_assigned = 'Not assigned'
+
+def peer_groupings(df):
+    # Groupings offered by the Market Analysis page, the label columns of the input besides Date and Institution Name
+    columns = [col for col in df.columns if col not in ('Date', 'Institution Name') and not is_numeric_dtype(df[col])]
+    return [whole_market, asset_size] + columns
+
+def asset_size_groups(df):
+    # Total Assets terciles among the institutions of each date, rows without Total Assets are of unknown size
+    rank = df.groupby('Date', sort=False)['Total Assets'].rank(method='first', pct=True).to_numpy()
+    codes = np.where(np.isnan(rank), len(asset_size_labels) - 1, np.ceil(np.nan_to_num(rank) * 3) - 1).astype(np.int8)
+    return pd.Categorical.from_codes(codes, categories=asset_size_labels)
+
+def column_groups(df, column):
+    # Labels of a grouping column, missing labels form a group of their own
+    labels = pd.Series(df[column].to_numpy(dtype=object)).where(df[column].notna().to_numpy(), not_assigned).astype(str)
+    return pd.Categorical(labels, categories=sorted(labels.unique()))
+
+def peer_groups(df, grouping=whole_market):
+    # Peer group of every row (categorical in display order), None for the whole market
+    if grouping == whole_market:
+        return None
+    if grouping == asset_size:
+        return asset_size_groups(df)
+    return column_groups(df, grouping)
+
+def market_tables(df, groups=None):
+    # Computed once per upload and peer grouping, the Market Analysis page only slices the result by date and group:
+    # 'values'    institution level totals and ratios (input row order, 'Date' column)
+    # 'benchmark' one benchmark row per (date, peer group), totals are sums and ratios are computed from the average
+    #             institution of the group
+    # 'relative'  group shares and relative differences of every institution to the benchmark of its date and group
+    # 'groups'    peer group label of every row and 'peer_groups' all labels in display order
+    groups = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[whole_market]) if groups is None else groups
+    df_values = add_camels_ratios(df.set_index('Institution Name'))[['Date'] + market_columns]
+
+    df_group = df.drop(columns='Institution Name').groupby(by=[df['Date'].to_numpy(), groups], sort=False, observed=True)
+    df_bench = add_camels_ratios(df_group.mean(numeric_only=True))
+    df_bench[total_columns] = df_group[total_columns].sum()
+    df_bench = df_bench[market_columns]
+    df_bench.index.names = ['Date', 'Peer Group']
+
+    # Broadcast back to the rows like transform, through the group number of every row
+    values = df_values[market_columns].to_numpy()
+    bench = df_bench.to_numpy()[df_group.ngroup().to_numpy()]
+    n_totals = len(total_columns)
+    df_relative = pd.concat([
+        pd.DataFrame(values[:, :n_totals] / bench[:, :n_totals], index=df_values.index, columns=relative_columns[:n_totals]),
+        pd.DataFrame((values[:, n_totals:] - bench[:, n_totals:]) / bench[:, n_totals:], index=df_values.index,
+                     columns=relative_columns[n_totals:])
+    ], axis=1)
+    df_relative.insert(0, 'Date', df_values['Date'])
+
+    return {'values': df_values, 'benchmark': df_bench, 'relative': df_relative,
+            'groups': np.asarray(groups, dtype=object), 'peer_groups': list(groups.categories)}
+
+def date_groups(tables, date):
+    # Peer groups with institutions at a date, in display order
+    present = set(tables['benchmark'].loc[date].index) if date in tables['benchmark'].index.levels[0] else set()
+    return [group for group in tables['peer_groups'] if group in present]
+
+def market_date_tables(tables, positions, date, group=whole_market):
+    # Benchmark row on top of the institution rows of one date and peer group, and their relative differences
+    positions = positions[tables['groups'][positions] == group]
+    df_bench = tables['benchmark'].loc[[(date, group)]]
+    df_bench.index = ['Benchmark values']
+    df_tot_sum = pd.concat([df_bench, tables['values'].iloc[positions].drop(columns='Date')], axis=0)
+    df_tot_sum.index.name = 'Institution Name'
+    df_tot_market = tables['relative'].iloc[positions].drop(columns='Date')
+    return df_tot_sum, df_tot_market
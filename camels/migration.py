@@ -0,0 +1,92 @@
+# Rating migration matrices, how institutions move between Final Rating grades from one reporting date to a later one
+#
+# Grades are integer coded into an institutions x dates matrix (dates in calendar order), so the transitions of every
+# date pair at any number of horizons are counted with one np.bincount over the combined (pair, from, to) indices.
+import numpy as np
+import pandas as pd
+
+from camels import model
+
+# Letter grades plus the '0' placeholder of scores outside [1, 5], best grade first
+grade_labels = list(model.final_rating_labels) + ['0']
+
+def grade_matrix(df_ratings):
+    # Institutions x dates grade codes (-1 where an institution does not report), the date labels as given
+    # in df_ratings (datetimes or dd-mm-YYYY strings) in calendar order and the institutions in order of appearance
+    dates = df_ratings['Date'].to_numpy()
+    date_codes, calendar = pd.factorize(pd.to_datetime(dates, dayfirst=True), sort=True)
+    first = np.unique(date_codes, return_index=True)[1]
+    institution_codes, institutions = pd.factorize(np.asarray(df_ratings.index))
+    codes = pd.Categorical(np.asarray(df_ratings['Final Rating'], dtype=object), categories=grade_labels).codes
+    matrix = np.full((len(institutions), len(calendar)), -1, dtype=np.int16)
+    matrix[institution_codes, date_codes] = codes
+    return matrix, list(dates[first]), list(institutions)
+
+def migration_counts(matrix, horizons=(1,)):
+    # Transition counts of every horizon (in reporting dates), horizon -> pairs x grades x grades array,
+    # pair i counts the moves from date i to date i + horizon, institutions missing either date are left out
+    n_grades = len(grade_labels)
+    n_dates = matrix.shape[1]
+    horizons = [h for h in dict.fromkeys(horizons) if 0 < h < n_dates]
+    flat, offsets = [], {}
+    offset = 0
+    for h in horizons:
+        source, target = matrix[:, :-h], matrix[:, h:]
+        valid = (source >= 0) & (target >= 0)
+        pairs = np.broadcast_to(np.arange(n_dates - h), source.shape)[valid]
+        flat.append(offset + (pairs * n_grades + source[valid]) * n_grades + target[valid])
+        offsets[h] = offset
+        offset += (n_dates - h) * n_grades * n_grades
+    counts = np.bincount(np.concatenate(flat).astype(np.int64), minlength=offset) if flat else np.zeros(0, dtype=np.int64)
+    return {h: counts[offsets[h]:offsets[h] + (n_dates - h) * n_grades * n_grades].reshape(n_dates - h, n_grades, n_grades)
+            for h in horizons}
+
+def transition_probabilities(counts):
+    # Row-normalized counts (share of the institutions of each starting grade), NaN for grades nobody starts from
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(totals > 0, counts / totals, np.nan)
+
+class RatingMigrations:
+    # Migration matrices of one ratings frame, computed for the requested horizons at once
+
+    def __init__(self, df_ratings, horizons=None):
+        self.matrix, self.dates, self.institutions = grade_matrix(df_ratings)
+        horizons = range(1, len(self.dates)) if horizons is None else horizons
+        self.counts = migration_counts(self.matrix, horizons)
+
+    def horizons(self):
+        return list(self.counts)
+
+    def pairs(self, horizon):
+        # (from date, to date) labels of the pairs of a horizon
+        return list(zip(self.dates[:-horizon], self.dates[horizon:]))
+
+    def grades(self):
+        # Grade labels shown, the '0' placeholder only when some institution has it
+        if (self.matrix == len(grade_labels) - 1).any():
+            return list(grade_labels)
+        return grade_labels[:-1]
+
+    def table(self, horizon, pair=None, probabilities=True):
+        # From grade x to grade frame of one date pair, or of all pairs of the horizon pooled when pair is None
+        counts = self.counts[horizon]
+        counts = counts.sum(axis=0) if pair is None else counts[pair]
+        n = len(self.grades())
+        values = transition_probabilities(counts[:n, :n]) if probabilities else counts[:n, :n]
+        return pd.DataFrame(values, index=pd.Index(self.grades(), name='From'), columns=pd.Index(self.grades(), name='To'))
+
+    def summary(self, horizon, pair=None):
+        # Share of upgrades, unchanged grades and downgrades among the institutions rated at both dates of the pair(s)
+        counts = self.counts[horizon]
+        counts = counts.sum(axis=0) if pair is None else counts[pair]
+        counts = counts[:len(grade_labels) - 1, :len(grade_labels) - 1] # moves from or to '0' have no direction
+        total = counts.sum()
+        if total == 0:
+            return {'Upgrades': np.nan, 'Unchanged': np.nan, 'Downgrades': np.nan, 'Transitions': 0}
+        return {
+            'Upgrades': np.tril(counts, -1).sum() / total, # better grades come first
+            'Unchanged': np.trace(counts) / total,
+            'Downgrades': np.triu(counts, 1).sum() / total,
+            'Transitions': int(total),
+        }
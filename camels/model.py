@@ -0,0 +1,212 @@
+# CAMELS feature extraction and rating model, independent of Streamlit
+import numpy as np
+import pandas as pd
+
+# Hard-coded bins for variables
+bins_dict = {'Tier 1 Capital Ratio':       ['expert', True, 0.06, 0.1, 0.14, 0.2], 
+        'Debt to Equity Ratio':            ['expert', False, 6, 8, 10, 12],
+        'NPL to Total Gross Loans Ratio':  ['expert', False, 0.04, 0.08, 0.12, 0.16],
+        'Loan Loss Provision Rate Scaled': ['expert', False, 0.02, 0.04, 0.06, 0.08],
+        'Asset Growth Rate 3Y Average':    ['expert', True, -0.03, 0, 0.03, 0.06],
+        'Efficiency Ratio':                ['expert', False, 0.5, 0.7, 0.9, 1.1],
+        'Return on Assets (ROA)':          ['expert', True, -0.002, 0.001, 0.005, 0.01],
+        'Interest Expenses to Interest Income Ratio': ['expert', False,  0.07, 0.14, 0.21, 0.28],
+        'Liquidity Coverage Ratio (LCR)':  ['expert', True,  1, 1.35, 1.7, 2],
+        'Cash Ratio':                      ['expert', True,  0.075, 0.15, 0.225, 0.3],
+        'Non Interest Income Share':       ['expert', True,  0.1, 0.2, 0.3, 0.4]}
+bins_columns = ['Binning Method', 'Reverse', '1st_Threshold', '2nd_Threshold', '3rd_Threshold', '4th_Threshold']
+
+def bins_frame(bins_dict):
+    return pd.DataFrame(bins_dict, index=bins_columns).T
+
+exp_bins = bins_frame(bins_dict)
+
+# Variables Weights
+camels_weights = pd.DataFrame({
+    'Tier 1 Capital Ratio': 0.09,
+    'Debt to Equity Ratio': 0.10,
+    'NPL to Total Gross Loans Ratio': 0.15,
+    'Loan Loss Provision Rate Scaled': 0.11,
+    'Asset Growth Rate 3Y Average': 0.09,
+    'Efficiency Ratio': 0.1,
+    'Return on Assets (ROA)': 0.1,
+    'Interest Expenses to Interest Income Ratio': 0.06, 
+    'Liquidity Coverage Ratio (LCR)': 0.01,
+    'Cash Ratio': 0.07,
+    'Non Interest Income Share': 0.12}, 
+    index = ['Weight']
+)
+
+mask = ['Variable 1', 'Variable 2',
+        'Variable 3', 'Variable 4',
+        'Variable 5', 'Variable 6',
+        'Variable 7', 'Variable 8',
+        'Variable 9', 'Variable 10',
+        'Variable 11']
+
+# Define Market Variables, a market per date by default, extra keys split it further (e.g. per scoring request)
+def loan_loss_provision_market(df, keys=('Date',)):
+
+    df_group = df[[*keys, 'Total Provisions','Total Gross Loans']].groupby(by=list(keys),sort=False).sum()
+    df_group['Market Loan Loss Rate'] = df_group['Total Provisions']/df_group['Total Gross Loans']
+    df_group = df_group.reset_index()
+
+    return df_group
+
+# Total Assets of the previous reporting dates, given by the input or derived from the panel's own history
+lag_columns = ['Total Assets (t-1)', 'Total Assets (t-2)', 'Total Assets (t-3)']
+
+def lagged_assets(df, lags=len(lag_columns)):
+    # Total Assets 1 ... lags reporting dates earlier: institutions x dates grid (dates in calendar order) shifted along
+    # the date axis, an institution missing a reporting date (gap) gets NaN for it instead of an older value
+    date_codes, dates = pd.factorize(pd.to_datetime(df['Date']), sort=True)
+    institution_codes, institutions = pd.factorize(df['Institution Name'], use_na_sentinel=False)
+    dated = date_codes >= 0
+    grid = np.full((len(institutions), lags + len(dates)), np.nan) # first lags columns pad the dates before the panel
+    grid[institution_codes[dated], lags + date_codes[dated]] = df['Total Assets'].to_numpy(dtype=float)[dated]
+    return pd.DataFrame({
+        f'Total Assets (t-{k})': np.where(dated, grid[institution_codes, lags + date_codes - k], np.nan) for k in range(1, lags + 1)
+    }, index=df.index)
+
+def derive_lagged_assets(df):
+    # Input with the lag columns taken from its history, provided lag columns fill in where the history is missing
+    # (first reporting dates of the panel, gaps, institutions entering the panel), missing ones are added
+    df = df.copy(deep=False)
+    lagged = lagged_assets(df)
+    for col in lag_columns:
+        df[col] = lagged[col].fillna(df[col]) if col in df.columns else lagged[col]
+    return df
+
+# CAMELS ratios from raw input columns, shared by the institution level variables and the market benchmark rows
+def add_camels_ratios(df_all):
+
+    # Capital Adequacy
+    df_all['Tier 1 Capital Ratio'] = df_all['Tier 1 Capital'] / df_all['RWA']
+    df_all['Debt to Equity Ratio'] = df_all['Total Liabilities'] / df_all['Total Equity']
+
+    # Asset Quality
+    df_all['NPL to Total Gross Loans Ratio'] = df_all['Stage 3 Exposure'] / df_all['Total Gross Loans']
+    df_all['Loan Loss Provision Rate'] = df_all['Total Provisions'] / df_all['Total Gross Loans']
+
+    # Management Quality
+    df_all['Asset Growth Rate'] = (df_all['Total Assets'] - df_all['Total Assets (t-1)']) / df_all['Total Assets (t-1)']
+    df_all['Asset Growth Rate (t-1)'] = (df_all['Total Assets (t-1)'] - df_all['Total Assets (t-2)']) / df_all['Total Assets (t-2)']
+    df_all['Asset Growth Rate (t-2)'] = (df_all['Total Assets (t-2)'] - df_all['Total Assets (t-3)']) / df_all['Total Assets (t-3)']
+    df_all['Asset Growth Rate 3Y Average'] = df_all[['Asset Growth Rate', 'Asset Growth Rate (t-1)', 'Asset Growth Rate (t-2)']].mean(axis=1)
+    df_all['Efficiency Ratio'] = df_all['Expenses'] / df_all['Net Operating Income']
+
+    # Earnings
+    df_all['Return on Assets (ROA)'] = df_all['Net Income'] / ((df_all['Total Assets'] + df_all['Total Assets (t-1)']) / 2)
+    df_all['Interest Expenses to Interest Income Ratio'] = df_all['Interest Expenses'] / df_all['Interest Income']
+
+    # Liquidity
+    df_all['Cash Ratio'] = df_all['Liquid Assets'] / df_all['Current Liabilities']
+
+    # Sensitivity
+    df_all['Non Interest Income Share'] = df_all['Non Interest Income'] / (df_all['Non Interest Income'] + df_all['Interest Income'])
+
+    return df_all
+
+# Define CAMELS Variables
+def df_var(df, df_market=None, keys=('Date',)):
+
+    # Market Loan Loss Rate defaults to the uploaded data, batch runs can pass a market-wide table
+    if df_market is None:
+        df_market = loan_loss_provision_market(df, keys)
+
+    # Merging Loan Loss Providion market and Input Data
+    df_all = pd.merge(df,df_market,how='inner',on=list(keys))
+    df_all = df_all.set_index('Institution Name')
+    df_all = df_all.drop(columns=['Total Provisions_y','Total Gross Loans_y'])
+    df_all = df_all.rename(columns={'Total Provisions_x':'Total Provisions','Total Gross Loans_x':'Total Gross Loans'})
+
+    df_all = add_camels_ratios(df_all)
+    df_all['Loan Loss Provision Rate Scaled'] = abs(df_all['Loan Loss Provision Rate']-df_all['Market Loan Loss Rate'])
+
+    # Select CAMELS Variables
+    df_final_var = df_all[[
+        'Date','Tier 1 Capital Ratio','Debt to Equity Ratio','NPL to Total Gross Loans Ratio','Loan Loss Provision Rate Scaled',
+        'Asset Growth Rate 3Y Average','Efficiency Ratio','Return on Assets (ROA)','Interest Expenses to Interest Income Ratio',
+        'Liquidity Coverage Ratio (LCR)','Cash Ratio','Non Interest Income Share'
+    ]]
+
+    return df_final_var
+
+# Composite Final Score boundaries and letter grades (A+ ... E-)
+# Score falls into grade i when final_rating_bounds[i] <= score < final_rating_bounds[i+1], last bound is inclusive
+final_rating_bounds = np.array([1, 1.25, 1.5, 1.95, 2.4, 2.9, 3.4, 3.9, 4.5, 4.75, 5])
+final_rating_labels = np.array(['A+','A-','B+','B-','C+','C-','D+','D-','E+','E-'], dtype=object)
+
+def rating_kernel_tables(bins_dict, camels_vars):
+    # Threshold matrix (variables x 4 thresholds) extracted from bins Dict
+    thresholds = np.array([bins_dict[cvar][2:6] for cvar in camels_vars], dtype=float)
+    # Subrating lookup table (variables x 6 bins), bin 5 is reserved for missing data (worst score)
+    # Check the variables interpretation, is a higher value better or worse?
+    reverse = np.array([bool(bins_dict[cvar][1]) for cvar in camels_vars])
+    lookup = np.where(reverse[:, None], [5,4,3,2,1,5], [1,2,3,4,5,5])
+    return thresholds, lookup
+
+def assign_subratings(values, thresholds, lookup):
+    # Bin index = number of thresholds strictly below the value (0 ... 4), all variables in one pass
+    bin_index = (values[:, :, None] > thresholds[None, :, :]).sum(axis=2)
+    bin_index[np.isnan(values)] = 5 # assign worst score (5) if data is missing
+    return lookup[np.arange(lookup.shape[0]), bin_index]
+
+def final_rating_codes(scores):
+    # Index into final_rating_labels, scores outside [1, 5] get -1 and missing scores the E- grade
+    grade_index = np.searchsorted(final_rating_bounds, scores, side='right') - 1
+    grade_index[scores == final_rating_bounds[-1]] = len(final_rating_labels) - 1
+    grade_index[(grade_index < 0) | (grade_index >= len(final_rating_labels))] = -1
+    grade_index[np.isnan(scores)] = len(final_rating_labels) - 1 # assign E- score if data is missing
+    return grade_index
+
+def assign_final_rating(scores):
+    # Boundary table lookup, scores outside [1, 5] keep the '0' placeholder
+    grade_index = final_rating_codes(scores)
+    in_range = grade_index >= 0
+    final_rating = np.full(scores.shape, '0', dtype=final_rating_labels.dtype)
+    final_rating[in_range] = final_rating_labels[grade_index[in_range]]
+    return final_rating
+
+def create_df_ratings(df_final, bins_dict, weights=None):
+
+    camels_vars = df_final.columns[1:]
+    thresholds, lookup = rating_kernel_tables(bins_dict, camels_vars)
+
+    # Extract numeric subratings
+    subratings = assign_subratings(df_final[camels_vars].to_numpy(dtype=float), thresholds, lookup)
+
+    return ratings_frame(df_final, subratings, weights)
+
+def ratings_frame(df_final, subratings, weights=None):
+    # Composite score and letter grade from a subratings matrix (rows x CAMELS variables)
+
+    weights = camels_weights if weights is None else weights
+    camels_vars = df_final.columns[1:]
+    df_ratings = pd.DataFrame(subratings, index=df_final.index, columns=camels_vars)
+
+    # Composite Final Numeric Rating, accumulated variable by variable so the result does not depend on memory layout
+    scores = np.zeros(len(df_ratings))
+    for j, weight in enumerate(weights[camels_vars].to_numpy()[0]):
+        scores = scores + subratings[:, j] * weight
+    df_ratings.insert(0, 'Composite Final Score', scores)
+
+    # Composite Final Qualitative Rating, 10 categories (+- added)
+    df_ratings.insert(0, 'Final Rating', assign_final_rating(scores))
+    df_ratings.insert(0, 'Date', df_final['Date'])
+
+    # Column reorder
+    df_ratings_column_order = [
+        'Date','Final Rating','Composite Final Score',
+        'Tier 1 Capital Ratio','Debt to Equity Ratio',
+        'NPL to Total Gross Loans Ratio','Loan Loss Provision Rate Scaled',
+        'Asset Growth Rate 3Y Average','Efficiency Ratio',
+        'Return on Assets (ROA)','Interest Expenses to Interest Income Ratio', 
+        'Liquidity Coverage Ratio (LCR)','Cash Ratio',
+        'Non Interest Income Share'
+    ]
+
+    if list(df_ratings.columns) != df_ratings_column_order:
+        df_ratings = df_ratings.reindex(columns=df_ratings_column_order)
+
+    return df_ratings
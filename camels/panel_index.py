@@ -0,0 +1,58 @@
+# Positional group indexes of the uploaded panel, built once at upload and shared by all pages
+#
+# camels_input, camels_variables and ratings keep the input row order, so one index serves all of them.
+import numpy as np
+import pandas as pd
+
+empty_positions = np.array([], dtype=np.intp)
+
+class PanelIndex:
+
+    def __init__(self, dates, institutions):
+        dates = pd.Series(np.asarray(dates))
+        institutions = pd.Series(np.asarray(institutions))
+        self.date_positions = dates.groupby(dates, sort=False).indices
+        self.institution_positions = institutions.groupby(institutions, sort=False).indices
+        # Sorted date list and institutions in order of first appearance, as shown in the selectors
+        self.dates = sorted(self.date_positions)
+        self.institutions = institutions.drop_duplicates().to_list()
+        self.date_order = {date: i for i, date in enumerate(self.dates)}
+        self.n_rows = len(dates)
+        self._categoricals = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        # Frame with a 'Date' column and 'Institution Name' as index or column
+        names = df['Institution Name'] if 'Institution Name' in df.columns else df.index
+        return cls(df['Date'], names)
+
+    def _categorical(self, name, positions, categories):
+        # Integer codes of every row into categories, built once and shared by all frames of the panel
+        if name not in self._categoricals:
+            codes = np.empty(self.n_rows, dtype=np.int32)
+            for code, label in enumerate(categories):
+                codes[positions[label]] = code
+            self._categoricals[name] = pd.Categorical.from_codes(codes, categories=categories) # int8/int16 codes
+        return self._categoricals[name]
+
+    def date_categorical(self):
+        return self._categorical('Date', self.date_positions, self.dates)
+
+    def institution_categorical(self):
+        return self._categorical('Institution Name', self.institution_positions, self.institutions)
+
+    def for_date(self, date):
+        return self.date_positions.get(date, empty_positions)
+
+    def for_dates(self, dates):
+        # Row positions of all selected dates, in input row order
+        groups = [self.date_positions[date] for date in dates if date in self.date_positions]
+        return np.sort(np.concatenate(groups)) if groups else empty_positions
+
+    def for_institutions(self, institutions):
+        # Row positions grouped by institution, in the order the institutions are given
+        groups = [self.institution_positions[inst] for inst in institutions if inst in self.institution_positions]
+        return np.concatenate(groups) if groups else empty_positions
+
+    def date_slice(self, df, date):
+        return df.iloc[self.for_date(date)]
@@ -0,0 +1,173 @@
+# Opt-in instrumentation of the dashboard, shown as a sidebar performance panel
+#
+# Records per rerun: wall time per stage, hit/miss of the dataset store and figure cache lookups and the payload size
+# of the large elements sent to the browser (recorded where they are rendered). The last runs are kept as a rolling
+# history.
+import functools
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+history_length = 50
+
+def enabled():
+    try:
+        return bool(st.session_state.get('perf_enabled', False))
+    except Exception:
+        # No session (e.g. called from a background thread)
+        return False
+
+def _current():
+    try:
+        return st.session_state.get('_perf_run')
+    except Exception:
+        return None
+
+def begin_run(page):
+    # Called first thing on every page, starts a new run record
+    if not enabled():
+        st.session_state['_perf_run'] = None
+        return
+    run = {'page': page, 'started': time.time(), 'start': time.perf_counter(),
+           'stages': [], 'cache': [], 'payload': [], 'context': []}
+    st.session_state['_perf_run'] = run
+
+@contextmanager
+def stage(name):
+    # Wall time of a block, no-op when instrumentation is disabled
+    run = _current()
+    if run is None:
+        yield
+        return
+    record = {'stage': name, 'seconds': None}
+    run['stages'].append(record)
+    run['context'].append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        run['context'].pop()
+
+def payload(element, size):
+    # Bytes of an element sent to the browser, recorded by the code rendering it (JSON of a figure, Arrow buffers of
+    # a table), size is a byte count or a function returning it, only called when instrumentation is on
+    run = _current()
+    if run is None:
+        return
+    run['payload'].append({'element': element, 'source': run['context'][-1] if run['context'] else '',
+                           'bytes': int(size() if callable(size) else size)})
+
+def arrow_bytes(df):
+    # Arrow buffers of a frame, about what st.dataframe sends
+    return pa.Table.from_pandas(df).nbytes
+
+@contextmanager
+def cached(name):
+    # Hit or miss of caches other than st.cache_*, the block sets the outcome:
+    #   with perf.cached('ratings_final_plot') as call:
+    #       spec, call['hit'] = figures.get_or_build(key, build)
+    call = {'hit': True}
+    run = _current()
+    if run is None:
+        yield call
+        return
+    run['context'].append(name)
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        run['context'].pop()
+        run['cache'].append({'function': name, 'result': 'hit' if call['hit'] else 'miss',
+                             'seconds': time.perf_counter() - start})
+
+def fragment(name):
+    # Fragment reruns skip the page script, they are recorded as their own run (listed in the history).
+    # Goes below @st.fragment, inside a full page run the fragment is part of that run:
+    #   @st.fragment
+    #   @perf.fragment('Time Series Comparison')
+    #   def time_series_comparison(): ...
+    def decorator(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if _current() is not None or not enabled():
+                return fn(*args, **kwargs)
+            begin_run(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _end_run()
+        return call
+    return decorator
+
+def _end_run():
+    run = _current()
+    if run is None:
+        return None
+    run['total_seconds'] = time.perf_counter() - run['start']
+    history = st.session_state.setdefault('perf_history', deque(maxlen=history_length))
+    history.append(run)
+    st.session_state['_perf_run'] = None
+    return run
+
+def _keep():
+    st.session_state['perf_enabled'] = st.session_state['_perf_enabled']
+
+def sidebar_panel():
+    # Called last on every page, closes the run record and renders the panel
+    run = _end_run()
+    # Permanent key survives page switches, the widget key is restored from it (see keep/unkeep in the pages)
+    st.session_state.setdefault('perf_enabled', False)
+    st.session_state['_perf_enabled'] = st.session_state['perf_enabled']
+    st.sidebar.toggle('Performance panel', key='_perf_enabled', on_change=_keep)
+    if not st.session_state['perf_enabled']:
+        return
+    if run is None:
+        st.sidebar.caption('Instrumentation starts with the next rerun.')
+        return
+
+    st.sidebar.markdown(f"**{run['page']}** rerun: {run['total_seconds']*1000:,.0f} ms")
+
+    if run['stages']:
+        df_stages = pd.DataFrame(run['stages'])[['stage', 'seconds']]
+        df_stages['ms'] = df_stages.pop('seconds') * 1000
+        st.sidebar.markdown('Stage wall time')
+        st.sidebar.dataframe(df_stages, hide_index=True, use_container_width=True,
+                             column_config={'ms': st.column_config.NumberColumn(format='%.1f')})
+
+    if run['cache']:
+        df_cache = pd.DataFrame(run['cache'])
+        df_cache = df_cache.groupby(['function', 'result'], sort=False).agg(
+            calls=('seconds', 'size'), ms=('seconds', 'sum')).reset_index()
+        df_cache['ms'] *= 1000
+        st.sidebar.markdown('Cached functions')
+        st.sidebar.dataframe(df_cache, hide_index=True, use_container_width=True,
+                             column_config={'ms': st.column_config.NumberColumn(format='%.1f')})
+
+    if run['payload']:
+        df_payload = pd.DataFrame(run['payload'])
+        df_payload = df_payload[df_payload['bytes'] > 1024].sort_values('bytes', ascending=False)
+        df_payload['kB'] = df_payload.pop('bytes') / 1024
+        total_kb = sum(p['bytes'] for p in run['payload']) / 1024
+        st.sidebar.markdown(f'Payload of charts and tables: {total_kb:,.0f} kB (elements above 1 kB)')
+        st.sidebar.dataframe(df_payload, hide_index=True, use_container_width=True,
+                             column_config={'kB': st.column_config.NumberColumn(format='%.1f')})
+
+    history = st.session_state.get('perf_history', [])
+    if len(history) > 1:
+        df_history = pd.DataFrame({
+            'rerun': range(len(history)),
+            'page': [r['page'] for r in history],
+            'ms': [r['total_seconds'] * 1000 for r in history],
+            'cache misses': [sum(c['result'] == 'miss' for c in r['cache']) for r in history],
+            'payload kB': [sum(p['bytes'] for p in r['payload']) / 1024 for r in history],
+        })
+        st.sidebar.markdown(f'History (last {len(history)} reruns)')
+        st.sidebar.line_chart(df_history, x='rerun', y='ms', height=150)
+        st.sidebar.dataframe(df_history.iloc[::-1], hide_index=True, use_container_width=True,
+                             column_config={'ms': st.column_config.NumberColumn(format='%.0f'),
+                                            'payload kB': st.column_config.NumberColumn(format='%.1f')})
@@ -0,0 +1,143 @@
+# Background pipeline of an uploaded dataset: parse -> market loss rate -> CAMELS variables -> ratings -> market benchmarks
+#
+# Stages run on a worker pool and put their results in the shared dataset store, under the entries the pages would
+# otherwise build on demand. Pages never wait on a stage, they show the stage progress until the pipeline of their
+# dataset is finished and then read the results from the store. Sessions uploading the same file share one pipeline.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from camels import market, model
+from camels.dataset_store import shared_store
+from camels.input_loaders import load_upload
+from camels.panel_index import PanelIndex
+from camels.profile import input_statistics
+from camels.recalibration import Recalibrator
+
+default_workers = int(os.environ.get('CAMELS_PIPELINE_WORKERS', 2))
+stage_names = ['Parse upload', 'Market loss rate', 'CAMELS variables', 'Ratings', 'Market benchmarks']
+
+def formatted_dates(dates):
+    # Displayed 'Date' strings, only the distinct dates of the panel are parsed and formatted, missing dates stay NaN
+    codes, uniques = pd.factorize(dates)
+    labels = pd.to_datetime(uniques).strftime('%d-%m-%Y').to_numpy(dtype=object)
+    return np.append(labels, np.nan)[codes]
+
+def formatted_input(df):
+    # Input with the displayed 'Date' strings, the frame previewed, indexed and profiled by the pages
+    df_input = df.copy(deep=False)
+    df_input['Date'] = formatted_dates(df_input['Date'])
+    return df_input
+
+class PipelineJob:
+    # Stage status of one dataset, 'pending', 'running', 'done' or 'failed' with the stage wall time
+
+    def __init__(self, dataset, store):
+        self.dataset = dataset
+        self.store = store
+        self.stages = {name: {'status': 'pending', 'seconds': None} for name in stage_names}
+        self.cache_hit = False
+        self.error = None
+        self._finished = threading.Event()
+
+    def _run_stage(self, name, body):
+        stage = self.stages[name]
+        stage['status'] = 'running'
+        start = time.perf_counter()
+        try:
+            result = body()
+        except Exception:
+            stage['status'] = 'failed'
+            raise
+        finally:
+            stage['seconds'] = time.perf_counter() - start
+        stage['status'] = 'done'
+        return result
+
+    def _entry(self, name, build):
+        return self.store.get_or_build(self.dataset, name, build)
+
+    def run(self, data, file_name, bins_dict, weights, derive_lags=False):
+        # Same entries (names and builds) as the Data Upload page, the ratings of the submitting session's
+        # calibration warm the subrating cache of the shared Recalibrator
+        def parse():
+            self.cache_hit = (self.dataset, 'upload') in self.store
+            def load():
+                df, self.cache_hit = load_upload(data, file_name, sheet_name='Institution_Data', derive_lags=derive_lags)
+                return df
+            upload = self._entry('upload', load)
+            df_input = formatted_input(upload)
+            self._entry('panel_index', lambda: PanelIndex.from_frame(df_input))
+            self._entry('input_statistics', lambda: input_statistics(df_input))
+            return upload, df_input
+
+        try:
+            upload, df_input = self._run_stage('Parse upload', parse)
+            loss_rate = self._run_stage('Market loss rate', lambda: self._entry(
+                'loan_loss_provision_market', lambda: model.loan_loss_provision_market(upload)))
+            df_final = self._run_stage('CAMELS variables', lambda: self._entry(
+                'df_var', lambda: model.df_var(upload, loss_rate)))
+            def ratings():
+                rating_model = self._entry('recalibrator', lambda: Recalibrator(df_final))
+                rating_model.ratings(rating_model.derived_bins(bins_dict), weights)
+            self._run_stage('Ratings', ratings)
+            self._run_stage('Market benchmarks', lambda: self._entry('market_tables', lambda: market.market_tables(df_input)))
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+
+    def parsed(self):
+        return self.stages['Parse upload']['status'] == 'done'
+
+    def finished(self):
+        return self._finished.is_set()
+
+    def failed(self):
+        return self.error is not None
+
+    def milestone(self):
+        # Changes when the pages have something new to show: the parsed upload, then all results
+        return 'finished' if self.finished() else 'parsed' if self.parsed() else 'parsing'
+
+class PipelinePool:
+    # Worker pool and the latest job of every dataset
+
+    def __init__(self, store, max_workers=default_workers):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='camels-pipeline')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, dataset, data, file_name, bins_dict, weights, derive_lags=False):
+        # Running or finished jobs are shared, failed jobs and jobs whose parsed upload was evicted run again
+        with self._lock:
+            job = self._jobs.get(dataset)
+            if job is not None and not job.failed() and (not job.finished() or (dataset, 'upload') in self.store):
+                return job
+            job = self._jobs[dataset] = PipelineJob(dataset, self.store)
+        self._executor.submit(job.run, data, file_name, bins_dict, weights, derive_lags)
+        return job
+
+    def job(self, dataset):
+        with self._lock:
+            return self._jobs.get(dataset)
+
+    def discard(self, dataset):
+        with self._lock:
+            self._jobs.pop(dataset, None)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def pipeline_pool():
+    # One worker pool per server process, over the shared dataset store
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PipelinePool(shared_store())
+        return _shared
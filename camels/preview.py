@@ -0,0 +1,118 @@
+# Server-side paginated preview of large panel frames
+#
+# Filtering (dates, institutions) uses the positional PanelIndex and sorting uses one cached argsort per column,
+# so every rerun only slices, formats and sends the visible window, never the whole frame.
+import os
+
+import numpy as np
+import pandas as pd
+
+default_max_cells = int(os.environ.get('CAMELS_PREVIEW_MAX_CELLS', 20000))
+page_sizes = [25, 50, 100, 250, 500, 1000]
+
+class PagedPreview:
+
+    def __init__(self, df, panel_index, key=None, columns=None, max_cells=default_max_cells):
+        # key identifies the frame content, a new frame object with the same key keeps the cached sort orders
+        self.df = df
+        self.panel_index = panel_index
+        self.key = key
+        self.columns = list(range(df.shape[1])) if columns is None else [df.columns.get_loc(col) for col in columns]
+        self.max_cells = max_cells
+        self._orders = {} # column position (-1 for the index) -> ascending positions, missing values last
+
+    def labels(self):
+        # Sortable labels, a named index (e.g. 'Institution Name') first
+        # Looked up by position, so the pages renaming columns in place is harmless
+        index = [self.df.index.name] if self.df.index.name is not None else []
+        return index + [self.df.columns[i] for i in self.columns]
+
+    def _column(self, label):
+        # Column position of a sortable label, -1 for the index
+        if label == self.df.index.name:
+            return -1
+        return self.columns[[self.df.columns[i] for i in self.columns].index(label)]
+
+    def _order(self, column):
+        if column not in self._orders:
+            values = pd.Series(self.df.index if column < 0 else self.df.iloc[:, column].to_numpy())
+            if column >= 0 and self.df.columns[column] == 'Date':
+                values = pd.to_datetime(values, dayfirst=True, errors='coerce') # dd-mm-YYYY strings sort by day otherwise
+            order = values.sort_values(kind='stable', na_position='last').index.to_numpy()
+            self._orders[column] = order, values.isna().to_numpy()
+        return self._orders[column]
+
+    def positions(self, dates=None, institutions=None, sort_by=None, descending=False):
+        # Row positions after filtering (None keeps everything) and sorting (None keeps the input order)
+        keep = None
+        if dates is not None:
+            keep = np.zeros(len(self.df), dtype=bool)
+            keep[self.panel_index.for_dates(dates)] = True
+        if institutions:
+            selected = np.zeros(len(self.df), dtype=bool)
+            selected[self.panel_index.for_institutions(institutions)] = True
+            keep = selected if keep is None else keep & selected
+
+        if sort_by is None:
+            return np.arange(len(self.df)) if keep is None else np.flatnonzero(keep)
+        order, missing = self._order(self._column(sort_by))
+        if keep is not None:
+            order = order[keep[order]]
+        if descending:
+            # Missing values stay last
+            last = missing[order]
+            order = np.concatenate([order[~last][::-1], order[last]])
+        return order
+
+    def page_size(self, requested):
+        # Rows per page, capped so a page never ships more than max_cells cells
+        return max(1, min(requested, self.max_cells // max(1, len(self.columns))))
+
+    def window(self, positions, page, page_size):
+        # Rows of page (1-based) of the given positions
+        start = (page - 1) * page_size
+        return self.df.iloc[positions[start:start + page_size], self.columns]
+
+def session_preview(name, df, panel_index, key, columns=None):
+    # PagedPreview kept in session state, rebuilt when the frame content (key) changes
+    import streamlit as st
+    preview = st.session_state.get(name)
+    if preview is None or preview.key != key:
+        preview = st.session_state[name] = PagedPreview(df, panel_index, key, columns)
+    preview.df = df
+    return preview
+
+def paged_dataframe(preview, key, dates=None, date_filter=False, format=None, **dataframe_kwargs):
+    # Filter, sort and page controls above st.dataframe of the visible window only,
+    # format(window) returns the frame or Styler to show, dataframe_kwargs go to st.dataframe
+    import streamlit as st
+    from camels import perf
+
+    controls = iter(st.columns([3, 3, 2, 1, 1] if date_filter else [3, 2, 1, 1]))
+    if date_filter:
+        dates = next(controls).multiselect('Dates', options=preview.panel_index.dates, key=f'{key}_dates',
+                                           placeholder='All dates') or None
+    institutions = next(controls).multiselect('Institutions', options=preview.panel_index.institutions, key=f'{key}_institutions',
+                                              placeholder='All institutions')
+    sort_by = next(controls).selectbox('Sort by', options=[None] + preview.labels(), key=f'{key}_sort_by',
+                                       format_func=lambda label: 'Input order' if label is None else label)
+    descending = next(controls).toggle('Descending', key=f'{key}_descending')
+
+    positions = preview.positions(dates, institutions, sort_by, descending)
+    requested = st.session_state.get(f'{key}_page_size', page_sizes[1])
+    page_size = preview.page_size(requested)
+    n_pages = max(1, -(-len(positions) // page_size))
+    if st.session_state.get(f'{key}_page', 1) > n_pages:
+        st.session_state[f'{key}_page'] = n_pages # filters removed rows, stay on the last page
+    # No max_value, a changing bound would make a new widget and reset the page
+    page = min(next(controls).number_input('Page', min_value=1, step=1, key=f'{key}_page'), n_pages)
+
+    window = preview.window(positions, page, page_size)
+    perf.payload('arrow_data_frame', lambda: perf.arrow_bytes(window))
+    st.dataframe(window if format is None else format(window), **dataframe_kwargs)
+
+    col1, col2 = st.columns([4, 1])
+    start = (page - 1) * page_size
+    col1.caption(f'Page {page} of {n_pages}, rows {min(start + 1, len(positions)):,} to {start + len(window):,} of {len(positions):,}'
+                 + (f' (at most {preview.max_cells:,} cells per page)' if page_size < requested else ''))
+    col2.selectbox('Rows per page', options=page_sizes, index=1, key=f'{key}_page_size', label_visibility='collapsed')
@@ -0,0 +1,56 @@
+# Input profile statistics (data types, nulls and descriptive statistics), computed once per upload
+#
+# Every statistic comes from one float64 copy of the numeric block, quantiles of inputs longer than exact_quantile_rows
+# are estimated with the mergeable QuantileSketch of the data-driven binning instead of sorting every column.
+import numpy as np
+import pandas as pd
+
+from camels.binning import QuantileSketch
+
+exact_quantile_rows = 1_000_000
+statistics_columns = ['Count', 'Mean', 'Min', 'First Quartile', 'Median', 'Third Quartile', 'Max', 'Standard Deviation']
+
+def numeric_statistics(values, exact_rows=exact_quantile_rows):
+    # Columns x statistics_columns of a float matrix, missing values are skipped like DataFrame.describe
+    missing = np.isnan(values)
+    count = len(values) - missing.sum(axis=0)
+    valid = count > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(missing, 0, values).sum(axis=0) / count
+        std = np.sqrt((np.where(missing, 0, values - mean) ** 2).sum(axis=0) / (count - 1))
+
+    table = np.full((values.shape[1], len(statistics_columns)), np.nan)
+    table[:, 0] = count
+    table[:, 1] = mean
+    table[:, 7] = np.where(count > 1, std, np.nan)
+    if len(values) <= exact_rows:
+        # Sorted columns (missing values last) give min, max and the linearly interpolated quartiles of DataFrame.describe
+        ordered = np.sort(values[:, valid], axis=0)
+        last = count[valid] - 1
+        ranks = np.array([0.25, 0.5, 0.75])[:, None] * last
+        lower, upper = np.floor(ranks).astype(np.int64), np.ceil(ranks).astype(np.int64)
+        below = np.take_along_axis(ordered, lower, axis=0)
+        above = np.take_along_axis(ordered, upper, axis=0)
+        table[valid, 2] = ordered[0]
+        table[valid, 3:6] = (below + (above - below) * (ranks - lower)).T
+        table[valid, 6] = np.take_along_axis(ordered, last[None, :], axis=0)[0]
+    else:
+        for j in np.flatnonzero(valid):
+            sketch = QuantileSketch().update(values[:, j])
+            table[j, 2], table[j, 6] = sketch.min_value, sketch.max_value
+            table[j, 3:6] = sketch.quantiles([0.25, 0.5, 0.75])
+    return table
+
+def input_statistics(df, exact_rows=exact_quantile_rows):
+    # Data Types, Null Values Sum and the statistics of the numeric columns, one row per input column
+    numeric = df.select_dtypes(include='number', exclude='timedelta').columns
+    df_describe = pd.DataFrame(
+        numeric_statistics(df[numeric].to_numpy(dtype=float, na_value=np.nan), exact_rows),
+        index=numeric, columns=statistics_columns
+    )
+    # Nulls of the numeric columns follow from the counts, only the other columns are scanned again
+    nulls = pd.Series(len(df) - df_describe['Count'].to_numpy(dtype=np.int64), index=numeric)
+    other = df.columns.drop(numeric)
+    nulls = pd.concat([nulls, df[other].isna().sum()]).reindex(df.columns)
+    df_info = pd.DataFrame({'Data Types': df.dtypes.astype(str), 'Null Values Sum': nulls})
+    return pd.concat([df_info, df_describe], axis=1)
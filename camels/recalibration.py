@@ -0,0 +1,97 @@
+# Interactive recalibration of thresholds and weights
+#
+# Subrating columns are cached per variable and threshold tuple, so editing one variable re-bins only that column
+# and a weights-only edit just recomputes the composite score and letter grade.
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from camels import binning, model
+
+threshold_columns = model.bins_columns[2:]
+calibration_columns = model.bins_columns + ['Weight']
+
+def calibration_table(bins_dict, weights):
+    # One editable row per CAMELS variable
+    table = model.bins_frame(bins_dict)
+    table['Reverse'] = table['Reverse'].astype(bool)
+    table[threshold_columns] = table[threshold_columns].astype(float)
+    table['Weight'] = weights.loc['Weight', table.index].astype(float)
+    return table
+
+def calibration_from_table(table):
+    # Back to the model's bins Dict and weights, rejects thresholds that would make empty or overlapping bins
+    # (thresholds of data-driven Binning Methods are only used when switching back to 'expert')
+    unknown = sorted(set(table['Binning Method']) - set(binning.binning_methods))
+    if unknown:
+        raise ValueError('Unknown binning method: ' + ', '.join(map(str, unknown)))
+    thresholds = table[threshold_columns].to_numpy(dtype=float)
+    weights = table['Weight'].to_numpy(dtype=float)
+    if np.isnan(thresholds).any() or np.isnan(weights).any():
+        raise ValueError('Thresholds and weights must not be empty.')
+    unordered = table.index[(np.diff(thresholds, axis=1) <= 0).any(axis=1)]
+    if len(unordered):
+        raise ValueError('Thresholds must be strictly increasing: ' + ', '.join(unordered))
+    if (weights < 0).any():
+        raise ValueError('Weights must not be negative.')
+    bins_dict = {
+        var: [method, bool(reverse)] + [float(t) for t in row]
+        for var, method, reverse, row in zip(table.index, table['Binning Method'], table['Reverse'], thresholds)
+    }
+    weights = pd.DataFrame([weights], index=['Weight'], columns=table.index)
+    return bins_dict, weights
+
+class Recalibrator:
+
+    def __init__(self, df_final, max_columns=256):
+        self.df_final = df_final.copy() # pages reformat the session frames in place
+        self.camels_vars = list(df_final.columns[1:])
+        self.values = df_final[self.camels_vars].to_numpy(dtype=float)
+        self.max_columns = max_columns
+        self.columns = OrderedDict() # (variable, reverse, thresholds) -> subrating column, LRU order
+        self.sketches = {} # variable -> quantile sketch of its values, for data-driven Binning Methods
+        self._lock = threading.Lock() # shared by the sessions of a dataset
+
+    def derived_bins(self, bins_dict):
+        # Thresholds of data-driven Binning Methods from the uploaded panel, sketched once per variable
+        with self._lock:
+            for var in binning.data_driven_variables(bins_dict):
+                if var not in self.sketches:
+                    self.sketches[var] = binning.sketch_variables(self.df_final, [var])[var]
+        return binning.derive_bins(bins_dict, self.sketches)
+
+    def subrating_column(self, var, bins):
+        key = (var, bool(bins[1]), tuple(float(t) for t in bins[2:6]))
+        with self._lock:
+            column = self.columns.get(key)
+            if column is not None:
+                self.columns.move_to_end(key)
+                return column, False
+        j = self.camels_vars.index(var)
+        thresholds, lookup = model.rating_kernel_tables({var: bins}, [var])
+        column = model.assign_subratings(self.values[:, j:j + 1], thresholds, lookup)[:, 0]
+        with self._lock:
+            self.columns[key] = column
+            while len(self.columns) > self.max_columns:
+                self.columns.popitem(last=False)
+        return column, True
+
+    def ratings(self, bins_dict, weights=None):
+        # Same output as model.create_df_ratings, plus re-binning stats
+        start = time.perf_counter()
+        subratings = np.empty(self.values.shape, dtype=int, order='F') # column-wise fill
+        rebinned = []
+        for j, var in enumerate(self.camels_vars):
+            subratings[:, j], computed = self.subrating_column(var, bins_dict[var])
+            if computed:
+                rebinned.append(var)
+        df_ratings = model.ratings_frame(self.df_final, subratings, weights)
+        stats = {
+            'rebinned_variables': rebinned,
+            'variables': len(self.camels_vars),
+            'seconds': time.perf_counter() - start,
+        }
+        return df_ratings, stats
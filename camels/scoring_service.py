@@ -0,0 +1,293 @@
+# Local HTTP scoring service, CAMELS ratings of institution records on demand without the dashboard
+#
+# Usage:
+#   python -m camels.scoring_service [--host 127.0.0.1] [--port 8600] [--max-batch-rows N] [--max-wait-ms MS]
+#                                    [--market FILE]
+#
+# POST /score    institution records in the input schema, a JSON list of records (or {"records": [...]}) or an Arrow IPC
+#                file/stream body (Content-Type application/vnd.apache.arrow.stream or .file), answered with the ratings
+#                as JSON records, or as an Arrow stream when the Accept header asks for it
+# GET  /metrics  request latency percentiles and micro-batch sizes
+# GET  /health   liveness check
+#
+# Requests arriving together are coalesced into micro-batches: a batch collects requests until --max-wait-ms passed
+# since its first one or --max-batch-rows rows are queued, then df_var and the ratings run once for the whole batch.
+# Every request stays its own market (Market Loan Loss Rate per request and date), unless --market gives a reference
+# panel whose per date market rates are used for the dates it covers. Standard library and the dashboard's own
+# dependencies only.
+import argparse
+import io
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as pa_ipc
+
+from camels import model
+from camels.input_loaders import date_column, lag_columns, load_upload, name_column, numeric_columns, prepared_input, read_arrow
+
+arrow_types = ('application/vnd.apache.arrow.stream', 'application/vnd.apache.arrow.file')
+required_columns = [date_column, name_column] + [col for col in numeric_columns if col not in lag_columns]
+request_column = 'Request'
+
+class InputError(ValueError):
+    # Records that can not be scored, answered with 400 and the message
+    pass
+
+def records_frame(body, content_type):
+    # Request body as an input frame in the dtypes df_var expects
+    try:
+        if content_type in arrow_types:
+            df = read_arrow(body)
+        else:
+            records = json.loads(body)
+            df = pd.DataFrame.from_records(records['records'] if isinstance(records, dict) else records)
+    except Exception as e:
+        raise InputError(f'Can not read the request body: {e}') from e
+    missing = [col for col in required_columns if col not in df.columns]
+    if missing:
+        raise InputError(f'Missing columns: {", ".join(missing)}')
+    try:
+        df = prepared_input(df)
+    except Exception as e:
+        raise InputError(f'Wrong data type: {e}') from e
+    if df[date_column].isna().any() or df[name_column].isna().any():
+        raise InputError('Every record needs a Date and an Institution Name')
+    return df
+
+def market_rates(df):
+    # Reference Market Loan Loss Rate per date
+    df_market = model.loan_loss_provision_market(df)
+    return df_market.set_index(date_column)['Market Loan Loss Rate']
+
+def score_frames(frames, bins_dict=model.bins_dict, weights=model.camels_weights, reference=None):
+    # Ratings of every frame, one df_var and one rating pass over all of them, returns one ratings frame per input frame
+    sizes = [len(frame) for frame in frames]
+    df = pd.concat(frames, ignore_index=True)
+    df.insert(0, request_column, np.repeat(np.arange(len(frames)), sizes))
+    df_market = model.loan_loss_provision_market(df, keys=(request_column, date_column))
+    if reference is not None:
+        rates = df_market[date_column].map(reference)
+        df_market['Market Loan Loss Rate'] = rates.fillna(df_market['Market Loan Loss Rate'])
+    # Inner merge keeps the input row order and every (request, date) has a market, so rows stay aligned with df
+    df_final = model.df_var(df, df_market, keys=(request_column, date_column))
+    df_ratings = model.create_df_ratings(df_final, bins_dict, weights)
+    bounds = np.cumsum([0] + sizes)
+    return [df_ratings.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+class Metrics:
+    # Rolling window of request latencies and batch sizes, totals since start
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window) # seconds, from request received to response ready
+        self.batch_requests = deque(maxlen=window)
+        self.batch_rows = deque(maxlen=window)
+        self.batch_seconds = deque(maxlen=window)
+        self.totals = {'requests': 0, 'errors': 0, 'batches': 0, 'rows': 0}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def request(self, seconds, error=False):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.totals['requests'] += 1
+            self.totals['errors'] += bool(error)
+
+    def batch(self, requests, rows, seconds):
+        with self._lock:
+            self.batch_requests.append(requests)
+            self.batch_rows.append(rows)
+            self.batch_seconds.append(seconds)
+            self.totals['batches'] += 1
+            self.totals['rows'] += rows
+
+    @staticmethod
+    def summary(values, scale=1):
+        if not values:
+            return {'count': 0}
+        values = np.asarray(values, dtype=float) * scale
+        p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+        return {'count': len(values), 'mean': values.mean(), 'p50': p50, 'p90': p90, 'p95': p95, 'p99': p99, 'max': values.max()}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime_seconds': time.time() - self.started,
+                **self.totals,
+                'latency_ms': self.summary(self.latencies, 1000),
+                'batch_ms': self.summary(self.batch_seconds, 1000),
+                'batch_requests': self.summary(self.batch_requests),
+                'batch_rows': self.summary(self.batch_rows),
+            }
+
+class MicroBatcher:
+    # Queue of (frame, future), one worker thread scores the queued frames batch by batch
+
+    def __init__(self, score, metrics, max_batch_rows=50000, max_wait=0.005):
+        self.score = score
+        self.metrics = metrics
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='camels-scoring', daemon=True)
+        self._worker.start()
+
+    def submit(self, df):
+        future = Future()
+        self._queue.put((df, future))
+        return future
+
+    def _collect(self):
+        # First queued request, then whatever arrives until the wait passed or the batch is full
+        batch = [self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            start = time.perf_counter()
+            try:
+                results = self.score([df for df, _ in batch])
+            except Exception:
+                # One bad request does not fail the others, score them one by one
+                results = []
+                for df, _ in batch:
+                    try:
+                        results.append(self.score([df])[0])
+                    except Exception as e:
+                        results.append(e)
+            self.metrics.batch(len(batch), rows, time.perf_counter() - start)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+class ScoringService:
+    # Scoring with a fixed calibration, the expert thresholds and weights of the dashboard by default
+
+    def __init__(self, bins_dict=model.bins_dict, weights=model.camels_weights, reference=None,
+                 max_batch_rows=50000, max_wait=0.005):
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(lambda frames: score_frames(frames, bins_dict, weights, reference), self.metrics,
+                                    max_batch_rows=max_batch_rows, max_wait=max_wait)
+
+    def score(self, df, timeout=None):
+        return self.batcher.submit(df).result(timeout)
+
+def ratings_records(df_ratings):
+    df = df_ratings.reset_index()
+    df[date_column] = pd.to_datetime(df[date_column]).dt.strftime('%Y-%m-%d')
+    return df
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    quiet = True
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, value):
+        self._send(status, json.dumps(value).encode())
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send_json(200, self.server.service.metrics.snapshot())
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        start = time.perf_counter()
+        service = self.server.service
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            content_type = self.headers.get('Content-Type', 'application/json').split(';')[0].strip()
+            df_ratings = ratings_records(service.score(records_frame(body, content_type)))
+        except InputError as e:
+            service.metrics.request(time.perf_counter() - start, error=True)
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            service.metrics.request(time.perf_counter() - start, error=True)
+            self._send_json(500, {'error': f'Scoring failed: {e}'})
+            return
+        if any(accept.split(';')[0].strip() in arrow_types for accept in self.headers.get('Accept', '').split(',')):
+            sink = io.BytesIO()
+            table = pa.Table.from_pandas(df_ratings, preserve_index=False)
+            with pa_ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            body, content_type = sink.getvalue(), arrow_types[0]
+        else:
+            body, content_type = df_ratings.to_json(orient='records').encode(), 'application/json'
+        service.metrics.request(time.perf_counter() - start)
+        self._send(200, body, content_type)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+def serve(service, host='127.0.0.1', port=8600, quiet=True):
+    # Threaded server, every connection waits for its micro-batch in its own thread
+    handler = type('Handler', (ScoringHandler,), {'quiet': quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve CAMELS ratings of institution records over local HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--max-batch-rows', type=int, default=50000, help='rows queued before a batch is scored (default: 50000)')
+    parser.add_argument('--max-wait-ms', type=float, default=5,
+                        help='longest wait for more requests after the first of a batch (default: 5 ms)')
+    parser.add_argument('--market', help='reference input file (xlsx, csv, parquet, arrow) for the Market Loan Loss Rate per date')
+    parser.add_argument('--log-requests', action='store_true', help='log every request to stderr')
+    args = parser.parse_args(argv)
+
+    reference = None
+    if args.market:
+        with open(args.market, 'rb') as f:
+            reference = market_rates(load_upload(f.read(), args.market)[0])
+    service = ScoringService(reference=reference, max_batch_rows=args.max_batch_rows, max_wait=args.max_wait_ms / 1000)
+    server = serve(service, args.host, args.port, quiet=not args.log_requests)
+    print(f'Scoring service on http://{args.host}:{server.server_port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# Monte Carlo weight sensitivity, probability of every final letter grade when the weights are perturbed
+#
+# Weight vectors are sampled from a Dirichlet distribution around the current weights and all of them are scored
+# in one float32 matrix multiply per chunk. Identical subrating rows share their scores, so rows are deduplicated first.
+import numpy as np
+import pandas as pd
+
+from camels import model
+
+# Letter grades plus the '0' placeholder of scores outside [1, 5]
+grade_columns = list(model.final_rating_labels) + ['0']
+
+def dirichlet_weights(weights, n_samples, concentration=100.0, seed=None):
+    # Samples keep the total of the current weights, a higher concentration means smaller perturbations
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    alpha = np.maximum(concentration * weights / total, 1e-3) # a zero weight is not a valid Dirichlet parameter
+    return np.random.default_rng(seed).dirichlet(alpha, size=n_samples) * total
+
+def grade_probabilities(subratings, weight_samples, max_chunk_bytes=64 * 2**20):
+    # Rows x grade_columns share of weight samples that give each grade
+    patterns, inverse = np.unique(subratings, axis=0, return_inverse=True)
+    patterns = patterns.astype(np.float32)
+    weights_t = weight_samples.T.astype(np.float32)
+    bounds = model.final_rating_bounds.astype(np.float32)
+    n_samples = len(weight_samples)
+    chunk = max(1, max_chunk_bytes // (n_samples * 5)) # float32 scores and one boolean mask per chunk
+
+    # Count of scores at or above every grade boundary, grades are the differences of neighbouring counts
+    at_or_above = np.empty((len(patterns), len(bounds) + 1), dtype=np.int64)
+    for start in range(0, len(patterns), chunk):
+        scores = patterns[start:start + chunk] @ weights_t
+        stop = start + len(scores)
+        for j, bound in enumerate(bounds):
+            at_or_above[start:stop, j] = (scores >= bound).view(np.uint8).sum(axis=1, dtype=np.int64)
+        at_or_above[start:stop, -1] = (scores > bounds[-1]).view(np.uint8).sum(axis=1, dtype=np.int64)
+
+    counts = np.empty((len(patterns), len(grade_columns)), dtype=np.int64)
+    counts[:, :-2] = at_or_above[:, :-3] - at_or_above[:, 1:-2]
+    counts[:, -2] = at_or_above[:, -3] - at_or_above[:, -1] # last grade includes the upper bound
+    counts[:, -1] = n_samples - at_or_above[:, 0] + at_or_above[:, -1]
+    return counts[inverse.ravel()] / n_samples
+
+def weight_sensitivity(df_ratings, weights, n_samples=2000, concentration=100.0, seed=None):
+    # Grade distribution of every institution and date, with the probability of keeping the current grade
+    # Subratings are taken by position, the pages rename them to the masked variable names
+    subratings = df_ratings.iloc[:, 3:].to_numpy(dtype=float)
+    samples = dirichlet_weights(weights.to_numpy()[0], n_samples, concentration, seed)
+    probabilities = grade_probabilities(subratings, samples)
+
+    current = model.final_rating_codes(df_ratings['Composite Final Score'].to_numpy(dtype=float))
+    current[current < 0] = len(grade_columns) - 1
+
+    df_sensitivity = pd.DataFrame(probabilities, index=df_ratings.index, columns=grade_columns)
+    if not df_sensitivity['0'].any():
+        df_sensitivity = df_sensitivity.drop(columns='0')
+    df_sensitivity.insert(0, 'Date', df_ratings['Date'])
+    df_sensitivity.insert(1, 'Final Rating', df_ratings['Final Rating'])
+    df_sensitivity.insert(2, 'Most Likely Rating', np.array(grade_columns, dtype=object)[probabilities.argmax(axis=1)])
+    df_sensitivity.insert(3, 'Current Rating Probability', probabilities[np.arange(len(probabilities)), current])
+
+    return df_sensitivity
@@ -0,0 +1,179 @@
+# Session frames of the uploaded dataset (camels_input, camels_variables, ratings, ...) for the session's calibration
+#
+# Shared entries (parsed upload, CAMELS variables, subratings, panel index, market tables) come from the dataset store,
+# filled by the background pipeline, only the ratings of the session's calibration, the date strings and the compact
+# copies are computed per session. The Data Upload page updates them on every rerun, the other pages when the
+# pipeline of the session's dataset finished while they were open.
+import streamlit as st
+
+from camels import binning, market, model, perf
+from camels.compact import compact_frame, expanded_frame, frame_bytes
+from camels.dataset_store import session_entry, shared_store
+from camels.incremental import IncrementalRater, model_key
+from camels.panel_index import PanelIndex
+from camels.pipeline import formatted_dates, formatted_input, pipeline_pool
+from camels.profile import input_statistics
+from camels.recalibration import Recalibrator, calibration_from_table
+
+input_error = (
+    'Please check the following in the input file:\n'
+    '1. The \'Date\' column is of datetime format\n'
+    '2. The \'Institution Name\' column is of string/object type\n'
+    '3. The rest of the columns are numerical (integer or float type)'
+)
+
+# Persisted per-date history for the incremental re-rating mode
+@st.cache_resource
+def incremental_rater():
+    return IncrementalRater()
+
+# Shared entries start from expanded_frame, so they do not depend on the compact storage of the building session
+def df_var(df):
+    with st.spinner('Feature Extraction ... '):
+        df = expanded_frame(df)
+        loss_rate = session_entry('loan_loss_provision_market', lambda: model.loan_loss_provision_market(df))
+        return model.df_var(df, loss_rate)
+
+def recalibrator(df_final):
+    with st.spinner('Model Calculation ... '):
+        return Recalibrator(df_final)
+
+def session_job():
+    # Background pipeline of the session's dataset, None when the upload did not go through the pipeline
+    dataset = st.session_state.get('dataset')
+    return None if dataset is None else pipeline_pool().job(dataset)
+
+def pending_job():
+    # Pipeline of the session's dataset while it is still running
+    job = session_job()
+    return job if job is not None and not job.finished() else None
+
+def pick_up_upload(job):
+    # Parsed upload of the pipeline into the session, as soon as the parse stage is done
+    if st.session_state.get('upload') is None and job is not None and job.parsed():
+        st.session_state['upload'] = shared_store().get(job.dataset, 'upload')
+        st.session_state['upload_cache_hit'] = job.cache_hit
+    return st.session_state.get('upload') is not None
+
+def update_input(df_input=None):
+    # Input frame with the displayed dates (by default a shallow copy of the upload), its panel index and statistics,
+    # all the input preview needs
+    df_input = formatted_input(st.session_state['upload']) if df_input is None else df_input
+    # Date and institution row positions, shared by all pages instead of full-column scans
+    with perf.stage('Build panel index'):
+        st.session_state['panel_index'] = session_entry('panel_index', lambda: PanelIndex.from_frame(expanded_frame(df_input)))
+    # Key of the uploaded data, its content hash
+    st.session_state['dataset_key'] = st.session_state['dataset']
+    # Data types, nulls and descriptive statistics of the input, the statistics expander only shows them
+    with perf.stage('Input statistics'):
+        st.session_state['input_statistics'] = session_entry('input_statistics', lambda: input_statistics(expanded_frame(df_input)))
+    return df_input
+
+def update(model_bins, model_weights):
+    # All session frames for the given calibration, returns the derived bins and the statistics the Data Upload page
+    # shows, raises ValueError with the message to show when the input can not be rated
+    stats = {}
+    # Compact storage shares the upload buffers, only the reformatted 'Date' column is new
+    df_input = st.session_state['upload'].copy(deep=not st.session_state.get('compact_storage', False))
+    if st.session_state.get('incremental_mode', False):
+        # Reuse persisted results of unchanged dates, compute only the delta
+        try:
+            with perf.stage('Incremental re-rating'):
+                df_final, df_ratings, stats['incremental'] = incremental_rater().score(df_input, model_bins, model_weights)
+            if binning.data_driven_variables(model_bins):
+                model_bins = binning.derive_bins(model_bins, binning.sketch_variables(df_final))
+        except Exception as e:
+            raise ValueError(input_error) from e
+    else:
+        try:
+            # Shallow copy, the session reformats its own 'Date' column
+            df_final = session_entry('df_var', lambda: df_var(df_input)).copy(deep=False)
+        except Exception as e:
+            raise ValueError('Error in data type!') from e
+        try:
+            # Subratings are cached per variable and thresholds, calibration edits re-bin only what changed
+            rating_model = session_entry('recalibrator', lambda: recalibrator(df_final))
+            with perf.stage('Rating model'):
+                model_bins = rating_model.derived_bins(model_bins)
+                df_ratings, stats['ratings'] = rating_model.ratings(model_bins, model_weights)
+        except Exception as e:
+            raise ValueError(input_error) from e
+
+    # Formatting Dates
+    with perf.stage('Format dates'):
+        df_input['Date'] = formatted_dates(df_input['Date'])
+        df_final['Date'] = formatted_dates(df_final['Date'])
+        df_ratings['Date'] = formatted_dates(df_ratings['Date'])
+
+    # Panel index, dataset key and input statistics
+    update_input(df_input)
+
+    # Key of the ratings (data, thresholds and weights), used by the figure cache
+    st.session_state['ratings_key'] = st.session_state['dataset_key'] + '-' + model_key(model_bins, model_weights)
+
+    # Market Analysis ratios and benchmarks for all dates, the Market Analysis page only slices them
+    with perf.stage('Market analysis tables'):
+        st.session_state['market_tables'] = session_entry('market_tables', lambda: market.market_tables(expanded_frame(df_input)))
+
+    # Compact session frames, dates and institution names become codes into the panel index labels
+    if st.session_state.get('compact_storage', False):
+        with perf.stage('Compact session frames'):
+            # Sizes without compaction, the upload and input sizes are only known before the first compaction
+            if st.session_state.get('storage_bytes') is None:
+                st.session_state['storage_bytes'] = frame_bytes(st.session_state['upload']) + frame_bytes(df_input)
+            stats['bytes_before'] = st.session_state['storage_bytes'] + frame_bytes(df_final) + frame_bytes(df_ratings)
+            panel_index = st.session_state['panel_index']
+            st.session_state['upload'] = compact_frame(st.session_state['upload'], panel_index)
+            df_input = compact_frame(df_input, panel_index)
+            df_final = compact_frame(df_final, panel_index, float32_decimals=4) # Data Preview shows 4 decimals
+            df_ratings = compact_frame(df_ratings, panel_index)
+            stats['bytes_after'] = frame_bytes(st.session_state['upload'], df_input, df_final, df_ratings)
+
+    # Saving Final Dataframes to Session State
+    st.session_state['expert_bins'] = model.bins_frame(model_bins)
+    st.session_state['weights'] = model_weights
+    st.session_state['camels_input'] = df_input
+    st.session_state['camels_variables'] = df_final
+    st.session_state['ratings'] = df_ratings
+    st.session_state['mask'] = model.mask
+    return model_bins, stats
+
+def pick_up():
+    # For the pages other than Data Upload: session frames of a pipeline that finished while they were open,
+    # returns the pipeline while it is still running (the page shows its progress instead of the results)
+    job = session_job()
+    if job is None or st.session_state.get('ratings') is not None:
+        return None
+    if not job.finished():
+        return job
+    if not job.failed() and 'calibration' in st.session_state and pick_up_upload(job):
+        try:
+            update(*calibration_from_table(st.session_state['calibration']))
+        except ValueError:
+            pass # the Data Upload page shows the error
+    return None
+
+def progress(job, poll_seconds=0.5):
+    # Stage by stage progress of a running pipeline, polled without rerunning the page,
+    # the page reruns once the pipeline has something new to show
+    milestone = job.milestone()
+
+    @st.fragment(run_every=poll_seconds)
+    def pipeline_progress():
+        if job.milestone() != milestone:
+            st.rerun()
+        done = [name for name, stage in job.stages.items() if stage['status'] == 'done']
+        running = [name for name, stage in job.stages.items() if stage['status'] == 'running']
+        st.progress(len(done) / len(job.stages),
+                    text=f'{running[0] if running else "Waiting for a worker"} ... ({len(done)} of {len(job.stages)} stages done)')
+        st.markdown(
+            '<div style="text-align: center; font-size: 14px; font-family: Arial; color: gray";>'
+            + ' &rarr; '.join(
+                f'{name} ({stage["seconds"]:.1f} s)' if stage['status'] == 'done' else
+                f'<b>{name}</b>' if stage['status'] == 'running' else name
+                for name, stage in job.stages.items()
+            ) + '</div>',
+            unsafe_allow_html=True
+        )
+
+    pipeline_progress()
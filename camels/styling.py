@@ -0,0 +1,87 @@
+# Styled tables of the Market Analysis page
+#
+# Cell colours are computed for the whole numeric block at once, they match Styler.background_gradient applied
+# column by column (per column min-max normalization). The cell CSS is computed once per table, for all rows, and
+# the tables are paged: only the rows of the visible page go through the Styler and to the browser.
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+cm_green = sns.light_palette("#175C2C", as_cmap=True)
+cm_blend_reverse = sns.blend_palette(colors=['#AA2417', '#FFECBD', '#175C2C'], as_cmap=True)
+cm_blend = sns.blend_palette(colors=['#175C2C', '#FFECBD', '#AA2417'], as_cmap=True)
+
+# Position of Loan Loss Provision Rate among the CAMELS variables, always coloured as lower is better
+loan_loss_position = 3
+
+def gradient_css(df, cmaps, text_color_threshold=0.408):
+    # Frame of 'background-color: ...;color: ...;' cells, cmaps holds one colormap per column
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smin = np.nanmin(values, axis=0) if len(values) else np.full(values.shape[1], np.nan)
+        smax = np.nanmax(values, axis=0) if len(values) else np.full(values.shape[1], np.nan)
+        scaled = np.where(smax > smin, (values - smin) / (smax - smin), np.where(np.isnan(values), np.nan, 0.0))
+
+    rgba = np.empty(values.shape + (4,))
+    for cmap in {id(cmap): cmap for cmap in cmaps}.values():
+        columns = [j for j, c in enumerate(cmaps) if c is cmap]
+        rgba[:, columns] = cmap(scaled[:, columns])
+
+    # W3C relative luminance decides between light and dark text
+    linear = np.where(rgba[..., :3] <= 0.04045, rgba[..., :3] / 12.92, ((rgba[..., :3] + 0.055) / 1.055) ** 2.4)
+    dark = linear @ np.array([0.2126, 0.7152, 0.0722]) < text_color_threshold
+
+    # Cells share few distinct colours, every distinct (colour, text) pair is formatted once
+    rgb = np.round(rgba[..., :3] * 255).astype(np.int64)
+    codes = ((rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2]) << 1) | dark
+    unique, inverse = np.unique(codes, return_inverse=True)
+    css = np.array([f"background-color: #{code >> 1:06x};color: {'#f1f1f1' if code & 1 else '#000000'};"
+                    for code in unique.tolist()], dtype=object)
+    return pd.DataFrame(css[inverse.reshape(codes.shape)], index=df.index, columns=df.columns)
+
+def variable_cmaps(exp_bins):
+    # Colormap of every CAMELS variable from the Reverse flag (higher values are better), taken by position
+    # so it does not matter whether the variables are named or masked
+    reverse = exp_bins['Reverse'].to_numpy(dtype=bool).copy()
+    reverse[loan_loss_position] = False
+    return [cm_blend_reverse if rev else cm_blend for rev in reverse]
+
+class StyledTable:
+    # Data, cell CSS and one format string per column
+
+    def __init__(self, data, css, formats):
+        self.data = data
+        self.css = css
+        self.formats = formats
+
+    def styler(self):
+        # pandas Styler with one format per column group and the cell CSS applied in one call, pandas groups the cells
+        # of every distinct style into a single rule when Streamlit translates it
+        styled = self.data.style
+        for fmt in dict.fromkeys(self.formats):
+            styled = styled.format(fmt, subset=[col for col, f in zip(self.data.columns, self.formats) if f == fmt])
+        return styled.apply(lambda _: self.css, axis=None)
+
+    def window(self, rows):
+        # Table of a window of the data rows, the colours stay those of the whole table
+        return StyledTable(rows, self.css.loc[rows.index, rows.columns],
+                           [self.formats[self.data.columns.get_loc(col)] for col in rows.columns])
+
+def styler_rel(df_tot_market, exp_bins):
+
+    css = gradient_css(df_tot_market, [cm_green, cm_green] + variable_cmaps(exp_bins))
+    return StyledTable(df_tot_market, css, ['{:.2%}'] * df_tot_market.shape[1])
+
+
+def styler_abs(df_tot_market, exp_bins):
+
+    css = gradient_css(df_tot_market, [cm_green, cm_green] + variable_cmaps(exp_bins))
+    formats = ['{:,.2f}' if col in ('Total Assets', 'Total Gross Loans') else '{:.2%}' for col in df_tot_market.columns]
+    return StyledTable(df_tot_market, css, formats)
+
+def paged_styled_dataframe(table, key, panel_index, preview_key, **dataframe_kwargs):
+    # Paged st.dataframe of a StyledTable, panel_index holds the table rows for the institution filter and preview_key
+    # identifies the table content
+    from camels.preview import paged_dataframe, session_preview
+    preview = session_preview(key, table.data, panel_index, preview_key)
+    return paged_dataframe(preview, key, format=lambda rows: table.window(rows).styler(), **dataframe_kwargs)
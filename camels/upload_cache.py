@@ -0,0 +1,98 @@
+# Content-hash keyed on-disk cache of parsed input workbooks
+import hashlib
+import io
+import os
+import uuid
+
+import pandas as pd
+
+# Bump when the stored layout changes so stale entries are never read back
+CACHE_FORMAT_VERSION = 1
+
+default_cache_dir = os.environ.get(
+    'CAMELS_UPLOAD_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.upload_cache')
+)
+default_max_bytes = int(os.environ.get('CAMELS_UPLOAD_CACHE_MB', 2048)) * 1024 * 1024
+
+def content_key(data, sheet_name):
+    # Same bytes and sheet give the same key, regardless of file name or session
+    digest = hashlib.blake2b(data, digest_size=20)
+    digest.update(f'|{sheet_name}|v{CACHE_FORMAT_VERSION}'.encode())
+    return digest.hexdigest()
+
+class UploadCache:
+
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=default_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.parquet')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except (OSError, ValueError):
+            return None
+        # Refresh access time, eviction removes least recently used entries first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, key, df):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Write to a temporary file first so concurrent sessions never read a partial entry
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            # Frames pyarrow can not store (e.g. mixed type columns) are simply not cached
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.parquet'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self):
+        # Size-bounded LRU, drop oldest entries until the cache fits into max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+def read_institution_data(data, sheet_name='Institution_Data', cache=None):
+    # Returns parsed frame and a flag telling if it was served from the cache
+    cache = cache if cache is not None else UploadCache()
+    key = content_key(data, sheet_name)
+    df = cache.get(key)
+    if df is not None:
+        return df, True
+    df = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name)
+    cache.put(key, df)
+    return df, False
@@ -1,12 +1,22 @@
 import streamlit as st
 
+from camels import perf, session_frames
+from camels.preview import paged_dataframe, session_preview
+
 # Set options
 st.set_page_config(page_title='CAMELS and Market Analysis Dashboard',layout='wide')
+perf.begin_run('CAMELS Data Preview')
+
+# Results of an upload still processed in the background are picked up once its pipeline finished
+job = session_frames.pick_up()
 
 # Gets data from session state
 df_final = st.session_state.get('camels_variables')
 df_ratings = st.session_state.get('ratings')
 mask = st.session_state.get('mask')
+panel_index = st.session_state.get('panel_index')
+dataset_key = st.session_state.get('dataset_key')
+ratings_key = st.session_state.get('ratings_key')
 
 # Copy from temporary widget key to permanent key
 def keep(key):
@@ -16,17 +26,16 @@ def keep(key):
 def unkeep(key):
     st.session_state[f"_{key}"] = st.session_state[key]
 
-# Checks if Data is Uploaded
-if df_final is not None:
-
-    df_ratings.columns = list(df_ratings.columns[:3]) + mask
-    df_final.columns = list(df_ratings.columns[:1]) + mask
-    # Replace Numerical to Alphabet ratings
-    df_ratings = df_ratings.drop(columns='Composite Final Score') # drop numeric rating
-    df_ratings.replace([1,2,3,4,5], ['A','B','C','D','E'],inplace=True)
+# Replace Numerical to Alphabet ratings, applied to the visible page only
+def letter_subratings(df_window):
+    return df_window.replace([1,2,3,4,5], ['A','B','C','D','E'])
 
+# Date multiselect and both tables, reruns on its own when the dates change
+@st.fragment
+@perf.fragment('CAMELS Data Preview: Tables')
+def preview_tables():
     # Get dates
-    dates = sorted(df_ratings['Date'].unique()) 
+    dates = panel_index.dates
     
     # Initialize Session State
     if 'date_multiselect' not in st.session_state:
@@ -40,28 +49,42 @@ if df_final is not None:
                                     key='_date_multiselect',
                                     on_change=keep,
                                     args=(('date_multiselect',)))
-    
-    df_ratings_multiselect = df_ratings[df_ratings['Date'].isin(selected_dates)]
-    df_final_multiselect = df_final[df_final['Date'].isin(selected_dates)]
 
-    # df_ratings_multiselect.columns = list(df_ratings_multiselect.columns[:2]) + mask
-    # df_final_multiselect.columns = list(df_ratings_multiselect.columns[:1]) + mask
-    # Display Dataframes
+    # Display Dataframes, only the visible page is sliced, formatted and sent
     st.markdown("<div style='text-align: center; font-size: 18px; font-weight: normal; font-family: Arial';"
             ">CAMELS Ratings and Subratings</div>", unsafe_allow_html=True)
-    st.dataframe(df_ratings_multiselect, use_container_width=True)
+    with perf.stage('Render ratings table'):
+        paged_dataframe(
+            session_preview('ratings_preview', df_ratings, panel_index, ratings_key,
+                            columns=df_ratings.columns.drop('Composite Final Score')), # drop numeric rating
+            'ratings_preview', dates=selected_dates, format=letter_subratings, use_container_width=True
+        )
     st.markdown('---')
     st.markdown("<div style='text-align: center; font-size: 18px; font-weight: normal; font-family: Arial';" 
             ">CAMELS Variables</div>", unsafe_allow_html=True)
-    st.dataframe(
-        df_final_multiselect,
-        column_config={col: st.column_config.NumberColumn(format='%.4f') for col in df_final_multiselect.columns[1:]},
-        use_container_width=True
-    ) 
+    with perf.stage('Render variables table'):
+        paged_dataframe(
+            session_preview('variables_preview', df_final, panel_index, dataset_key),
+            'variables_preview', dates=selected_dates,
+            column_config={col: st.column_config.NumberColumn(format='%.4f') for col in df_final.columns[1:]},
+            use_container_width=True
+        )
 
+# Checks if Data is Uploaded
+if df_final is not None:
+
+    df_ratings.columns = list(df_ratings.columns[:3]) + mask
+    df_final.columns = list(df_ratings.columns[:1]) + mask
+
+    preview_tables()
+
+elif job is not None:
+    session_frames.progress(job)
 else:
     st.markdown(
         "<div style='text-align: left; font-size: 18px; font-weight: normal; font-family: Arial';" 
         ">No dataframe uploaded. Please upload file in <b><i>Data Upload and Information</i></b> section!</div>", 
         unsafe_allow_html=True
     )
+
+perf.sidebar_panel()
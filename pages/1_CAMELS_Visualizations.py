@@ -1,16 +1,21 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
+
+from camels import charts, perf, session_frames
+from camels.figure_cache import FigurePrefetcher, figure_json, plotly_json_chart, shared_figure_cache
 
 # Set options
 st.set_page_config(page_title='CAMELS and Market Analysis Dashboard', layout='wide')
+perf.begin_run('CAMELS Visualizations')
+
+# Results of an upload still processed in the background are picked up once its pipeline finished
+job = session_frames.pick_up()
 
 # Gets data from session state
 df_final = st.session_state.get('camels_variables')
 df_ratings = st.session_state.get('ratings')
 df_bins = st.session_state.get('expert_bins')
 mask = st.session_state.get('mask')
+panel_index = st.session_state.get('panel_index')
 
 # Ratings Final Score Thresholds
 rating_thresholds = {
@@ -28,171 +33,122 @@ def keep(key):
 def unkeep(key):
     st.session_state[f"_{key}"] = st.session_state[key]
 
-@st.cache_data(ttl=7200)
-def auto_adjust_height(ylabel_count, font_size=14, multiplier=2.0, padding=50):
-    height = padding + (np.multiply(ylabel_count, font_size) * multiplier)
-    return height
-
-# Plotting Functions
-@st.cache_resource(show_spinner="Plotting Data ... ", ttl=7200)
-def ratings_final_plot(df, date, range_score):
-    filter_df = df[df['Date'] == date]
-    filter_df = filter_df[['Date', 'Composite Final Score', 'Final Rating']].reset_index().sort_values('Composite Final Score', ascending=True)
-    fig = px.bar(data_frame=filter_df, x='Composite Final Score', y='Institution Name',
-                 color='Final Rating', text='Final Rating', 
-                 color_discrete_map={
-                    'A+': '#175C2C', 'A-': '#2C8646',
-                    'B+': '#86DB4F', 'B-': '#C4FC9F',
-                    'C+': '#FFECBD', 'C-': '#FFC83D',
-                    'D+': '#FFA929', 'D-': '#FD6412',
-                    'E+': '#E0301E', 'E-': '#AA2417'},
-                 orientation='h')
-    fig.update_layout(title='Financial Institutions Final Ratings',
-                      height=int(auto_adjust_height(len(df.index.unique()))),
-                      xaxis=dict(showgrid=True, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14), tickmode='linear', dtick=0.5),
-                      yaxis=dict(showgrid=True, categoryorder="total descending", title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
-                      legend=dict(title='Final Rating', font=dict(size=14), title_font=dict(size=14), traceorder='normal'),
-                      hovermode='closest',
-                      font=dict(family='Arial'),
-                      title_font=dict(family='Arial', size=18))
-    fig.update_traces(textangle=0, textposition="outside")
-    fig.add_vline(x=range_score['1st'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score['2nd'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score['3rd'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score['4th'], line_width=2, line_dash="dot", opacity=0.6)
-    
-    return st.plotly_chart(fig, use_container_width=True)
-
-@st.cache_resource(show_spinner="Plotting Data ... ", ttl=7200)
-def variables_final_plot(df_r, df_v, date, range_score, var):
-    df_r_filter = df_r[df_r['Date'] == date][['Date', var]]
-    df_v_filter = df_v[df_v['Date'] == date][['Date', var]]
-    filter_df = pd.merge(df_r_filter, df_v_filter, how='inner', left_index=True, right_index=True).reset_index()
-    filter_df = filter_df.sort_values(filter_df.columns[2], ascending=True)
-    filter_df[var+' Rating Adjusted'] = filter_df[var+'_x'].replace([1, 2, 3, 4, 5], ['A', 'B', 'C', 'D', 'E'])
-    category_order = 'total ascending' if range_score.loc[var, 'Reverse'] else 'total descending'
-    filter_df.rename(columns={(var+'_y'):var}, inplace=True)
-    filter_df[var] = round(filter_df[var], 3)
-    
-    fig = px.bar(data_frame=filter_df, x=var, y='Institution Name',
-                 color=var+' Rating Adjusted', text=var+' Rating Adjusted', 
-                 color_discrete_map={
-                    'A': '#175C2C',
-                    'B': '#86DB4F',
-                    'C': '#FFECBD',
-                    'D': '#FFA929',
-                    'E': '#E0301E'},
-                 orientation='h')
-    fig.update_layout(title=var + ' Ratings',
-                      height=int(auto_adjust_height(len(df_r.index.unique()))),
-                      xaxis_title=var,
-                      xaxis=dict(showgrid=True, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
-                      yaxis=dict(showgrid=True, categoryorder=category_order, title_font=dict(size=16, family='Arial'), tickfont=dict(size=14)),
-                      legend_title_text=var+' Rating',
-                      legend=dict(font=dict(size=14), title_font=dict(size=14), traceorder='normal', orientation='h',
-                                  yanchor='bottom', yref='container', xanchor='right', xref='paper'),
-                      hovermode='closest',
-                      font=dict(family='Arial'),
-                      title_font=dict(family='Arial', size=18))
-    fig.update_traces(textangle=0, textposition="outside")
-    fig.add_vline(x=range_score.loc[var, '1st_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score.loc[var, '2nd_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score.loc[var, '3rd_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
-    fig.add_vline(x=range_score.loc[var, '4th_Threshold'], line_width=2, line_dash="dot", opacity=0.6)
-    
-    return st.plotly_chart(fig, use_container_width=True)
+# Serialized figures shared by all sessions, keyed by the ratings key and what the figure shows
+def figure_cache():
+    return shared_figure_cache()
+
+@st.cache_resource
+def figure_prefetcher():
+    return FigurePrefetcher(figure_cache())
+
+# Chart groups (tabs), Ratings Final or positions of the variables in the ratings columns
+chart_groups = {
+    'Ratings Final': None,
+    '(C) Capital Adequacy': [3, 4],
+    '(A) Asset Quality': [5, 6],
+    '(M) Management': [7, 8],
+    '(E) Earnings': [9, 10],
+    '(L) Liquidity': [11, 12],
+    '(S) Sensitivity': [13],
+}
+
+# Plotting Functions, (cache key, figure builder) of every chart
+def ratings_final_chart(df, date, range_score, panel_index):
+    key = ('ratings_final', st.session_state['ratings_key'], date, tuple(range_score.items()))
+    return key, lambda: charts.ratings_final_figure(panel_index.date_slice(df, date), len(panel_index.institutions), range_score)
+
+def variables_final_chart(df_r, df_v, date, range_score, var, panel_index):
+    # var is the displayed (masked) variable name, its thresholds are part of the ratings key
+    key = ('variables_final', st.session_state['ratings_key'], date, var)
+    return key, lambda: charts.variables_final_figure(panel_index.date_slice(df_r, date), panel_index.date_slice(df_v, date),
+                                                      len(panel_index.institutions), range_score, var)
+
+def group_charts(group, date):
+    if chart_groups[group] is None:
+        return [ratings_final_chart(df_ratings, date, rating_thresholds, panel_index)]
+    return [variables_final_chart(df_ratings, df_final, date, df_bins, df_ratings.columns[position], panel_index)
+            for position in chart_groups[group]]
+
+def plotly_cached_chart(name, key, build):
+    def build_figure():
+        with st.spinner('Plotting Data ... '):
+            return build()
+    with perf.cached(name) as call:
+        spec, call['hit'] = figure_cache().get_or_build(key, build_figure)
+        plotly_json_chart(spec, use_container_width=True)
+
+def render_group(group, date):
+    group_chart_list = group_charts(group, date)
+    if chart_groups[group] is None:
+        plotly_cached_chart('ratings_final_plot', *group_chart_list[0])
+        return
+    # Two charts side by side, a single chart keeps the left half
+    for column, chart in zip(st.columns(2), group_chart_list + [None]):
+        with column:
+            if chart is None:
+                st.write('')
+            else:
+                plotly_cached_chart('variables_final_plot', *chart)
 
 # Callback function, Store Index position of selected_date
 def update_selected_date_index():
-    st.session_state['selected_date_index'] = sorted(df_ratings['Date'].unique()).index(st.session_state['selected_date'])
+    st.session_state['selected_date_index'] = panel_index.date_order[st.session_state['selected_date']]
 
 def update_selected_var_index():
     st.session_state['camels_var_index'] = df_final.columns[1:].to_list().index(st.session_state['camels_var'])
 
-# Checks if Data is Uploaded 
-if df_final is not None:
-    
-    df_ratings.columns = list(df_ratings.columns[:3]) + mask
-    df_final.columns = list(df_ratings.columns[:1]) + mask
-    df_bins.index = mask
-    
+# Bar Charts section, reruns on its own when the date or the chart group changes
+@st.fragment
+@perf.fragment('CAMELS Visualizations: Bar Charts')
+def bar_charts():
     st.subheader('Bar Charts')
     # Initialize Session State
     if 'selected_date_index' not in st.session_state:
-        st.session_state['selected_date_index'] = len(sorted(df_ratings['Date'].unique())) - 1
+        st.session_state['selected_date_index'] = len(panel_index.dates) - 1
     
     # Create Date Selectbox with callback
     st.selectbox(
         r"$\textsf{\normalsize Select Date:}$", 
-        options = sorted(df_ratings['Date'].unique()), 
+        options = panel_index.dates, 
         index=st.session_state['selected_date_index'], 
         key='selected_date', 
         on_change=update_selected_date_index
     )
 
-    # Create Tabs
-    ratings_final, capital_adequacy, asset_quality, management, earnings, liquidity, sensitivity = st.tabs(
-        ['Ratings Final', '(C) Capital Adequacy', '(A) Asset Quality', '(M) Management', '(E) Earnings', '(L) Liquidity', '(S) Sensitivity']
-    )
-    
-    # Ratings Final Tab
-    with ratings_final:       
-        ratings_final_plot(df_ratings, st.session_state['selected_date'], rating_thresholds)
-
-    # Capital Adequacy Tab
-    with capital_adequacy:
-        tier_1_capital, debt_to_equity = st.columns(2)
-        with tier_1_capital:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[3])
-        with debt_to_equity:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[4])
-
-    # Asset Quality Tab
-    with asset_quality:
-        npl_to_gross_loans, loan_loss_provision = st.columns(2)
-        with npl_to_gross_loans:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[5])
-        with loan_loss_provision:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[6])
-
-    # Management Tab
-    with management:
-        asset_growth, efficiency = st.columns(2)
-        with asset_growth:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[7])
-        with efficiency:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[8])
-
-    # Earnings Tab
-    with earnings:
-        return_on_assets, interest_expenses_to_income = st.columns(2)
-        with return_on_assets:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[9])
-        with interest_expenses_to_income:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[10])
-
-    # Liquidity Tab
-    with liquidity:
-        liquidity_coverage, cash = st.columns(2)
-        with liquidity_coverage:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[11])
-        with cash:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[12])
-
-    # Sensitivity Tab
-    with sensitivity:
-        non_interest_income, _placeholder = st.columns(2)
-        with non_interest_income:
-            variables_final_plot(df_ratings, df_final, st.session_state['selected_date'], df_bins, df_ratings.columns[13])
-        with _placeholder:
-            st.write('')
-    
-    st.markdown('---')
+    # Initialize Session State
+    if 'lazy_charts' not in st.session_state:
+        st.session_state['lazy_charts'] = True
+    if 'chart_group' not in st.session_state:
+        st.session_state['chart_group'] = list(chart_groups)[0]
+
+    unkeep('lazy_charts')
+    st.toggle('Render the selected tab only', key='_lazy_charts', on_change=keep, args=(('lazy_charts',)),
+              help='Only the charts of the selected tab are built and sent to the browser, the next tab is prepared in the background')
+
+    if st.session_state['lazy_charts']:
+        # Lazy mode, one group at a time, the next group is prefetched into the figure cache
+        unkeep('chart_group')
+        group = st.radio('Chart group', options=list(chart_groups), horizontal=True, label_visibility='collapsed',
+                         key='_chart_group', on_change=keep, args=(('chart_group',)))
+        render_group(group, st.session_state['selected_date'])
+        next_group = list(chart_groups)[(list(chart_groups).index(group) + 1) % len(chart_groups)]
+        for key, build in group_charts(next_group, st.session_state['selected_date']):
+            figure_prefetcher().submit(key, build)
+    else:
+        # Create Tabs
+        for tab, group in zip(st.tabs(list(chart_groups)), chart_groups):
+            with tab:
+                render_group(group, st.session_state['selected_date'])
+
+# Time Series Comparison section, reruns on its own when the variable or the institutions change
+@st.fragment
+@perf.fragment('CAMELS Visualizations: Time Series')
+def time_series_comparison():
     st.subheader('Time Series Comparison')
     
     # Initialize Session State
     if 'inst_multiselect' not in st.session_state:
-        st.session_state['inst_multiselect'] = df_final.index[0:2].to_list()  # first 2 institutions
+        st.session_state['inst_multiselect'] = panel_index.institutions[0:2]  # first 2 institutions
 
     if 'camels_var_index' not in st.session_state:
         st.session_state['camels_var_index'] = 1
@@ -206,21 +162,36 @@ if df_final is not None:
     
     unkeep('inst_multiselect')
     selected_inst = st.multiselect(r"$\textsf{\normalsize Multiselect Institution:}$", 
-                                    options=df_final.index.unique().to_list(), 
+                                    options=panel_index.institutions, 
                                     default=st.session_state['inst_multiselect'],
                                     key='_inst_multiselect',
                                     on_change=keep,
                                     args=(('inst_multiselect',)))
     
-    fig = px.line(round(df_final.loc[selected_inst].reset_index().sort_values('Date'), 3), x='Date', y=st.session_state['camels_var'], 
-                  color='Institution Name', text=st.session_state['camels_var'])
-    fig.update_traces(textposition="bottom right")
-    st.plotly_chart(fig, use_container_width=True)
+    with perf.stage('Time series chart'):
+        fig = charts.time_series_figure(df_final.iloc[panel_index.for_institutions(selected_inst)], st.session_state['camels_var'])
+        perf.payload('plotly_chart', lambda: len(figure_json(fig)))
+        st.plotly_chart(fig, use_container_width=True)
+
+# Checks if Data is Uploaded 
+if df_final is not None:
+    
+    df_ratings.columns = list(df_ratings.columns[:3]) + mask
+    df_final.columns = list(df_ratings.columns[:1]) + mask
+    df_bins.index = mask
+    
+    bar_charts()
+    st.markdown('---')
+    time_series_comparison()
 
 # Display Text when Data Input is Missing
+elif job is not None:
+    session_frames.progress(job)
 else:
     st.markdown(
         "<div style='text-align: left; font-size: 18px; font-weight: normal; font-family: Arial';" 
         ">No dataframe uploaded. Please upload file in <b><i>Data Upload and Information</i></b> section!</div>", 
         unsafe_allow_html=True
     )
+
+perf.sidebar_panel()
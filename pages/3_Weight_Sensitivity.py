@@ -0,0 +1,103 @@
+import streamlit as st
+
+from camels import charts, perf, session_frames
+from camels.dataset_store import session_entry
+from camels.figure_cache import figure_json
+from camels.sensitivity import weight_sensitivity
+
+# Set options
+st.set_page_config(page_title='CAMELS and Market Analysis Dashboard', layout='wide')
+perf.begin_run('Weight Sensitivity')
+
+# Results of an upload still processed in the background are picked up once its pipeline finished
+job = session_frames.pick_up()
+
+# Gets data from session state
+df_ratings = st.session_state.get('ratings')
+weights = st.session_state.get('weights')
+panel_index = st.session_state.get('panel_index')
+
+all_dates = 'All dates'
+
+# Sensitivity Functions, results are shared by the sessions of a dataset per ratings key and parameters
+def sensitivity(df_ratings, weights, date, n_samples, concentration, seed):
+    def build():
+        with st.spinner('Sampling Weights ... '):
+            return weight_sensitivity(df_ratings, weights, n_samples, concentration, seed)
+    return session_entry(('sensitivity', st.session_state['ratings_key'], date, n_samples, concentration, seed), build)
+
+# Callback function, store submitted parameters
+def update_sensitivity_params():
+    st.session_state['sensitivity_params'] = {
+        'date': st.session_state['_sensitivity_date'],
+        'n_samples': st.session_state['_sensitivity_samples'],
+        'concentration': st.session_state['_sensitivity_concentration'],
+        'seed': st.session_state['_sensitivity_seed'],
+    }
+
+# Checks if Data is Uploaded
+if df_ratings is not None:
+
+    # Initialize Session State
+    if 'sensitivity_params' not in st.session_state:
+        st.session_state['sensitivity_params'] = None
+    params = st.session_state['sensitivity_params'] or {
+        'date': panel_index.dates[-1], 'n_samples': 2000, 'concentration': 100.0, 'seed': 0
+    }
+    date_options = [all_dates] + list(panel_index.dates)
+
+    st.subheader('Weight Sensitivity')
+    with st.form('sensitivity_form', border=False):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.selectbox(r"$\textsf{\normalsize Select Date:}$", options=date_options,
+                       index=date_options.index(params['date']) if params['date'] in date_options else len(date_options) - 1,
+                       key='_sensitivity_date')
+        col2.number_input(r"$\textsf{\normalsize Weight Samples:}$", min_value=100, max_value=20000, step=100,
+                          value=params['n_samples'], key='_sensitivity_samples')
+        col3.number_input(r"$\textsf{\normalsize Concentration:}$", min_value=1.0, max_value=10000.0, step=10.0,
+                          value=params['concentration'], key='_sensitivity_concentration',
+                          help='Dirichlet concentration around the current weights, higher values mean smaller perturbations')
+        col4.number_input(r"$\textsf{\normalsize Random Seed:}$", min_value=0, step=1, value=params['seed'], key='_sensitivity_seed')
+        st.form_submit_button('Run', on_click=update_sensitivity_params)
+
+    if st.session_state['sensitivity_params'] is not None:
+        if params['date'] == all_dates:
+            df_selected = df_ratings
+        else:
+            df_selected = df_ratings.iloc[panel_index.for_date(params['date'])]
+        df_sensitivity = sensitivity(df_selected, weights, params['date'], params['n_samples'], params['concentration'], params['seed'])
+        grades = list(df_sensitivity.columns[4:])
+
+        # Summary
+        col1, col2 = st.columns(2)
+        col1.metric('Average Probability of Current Rating', f"{df_sensitivity['Current Rating Probability'].mean():.1%}")
+        col2.metric('Ratings Kept in Less than Half of Samples', f"{(df_sensitivity['Current Rating Probability'] < 0.5).mean():.1%}")
+
+        st.markdown("<div style='text-align: center; font-size: 18px; font-weight: normal; font-family: Arial';"
+                ">Final Rating Probabilities</div>", unsafe_allow_html=True)
+        with perf.stage('Render sensitivity table'):
+            perf.payload('arrow_data_frame', lambda: perf.arrow_bytes(df_sensitivity))
+            st.dataframe(
+                df_sensitivity,
+                column_config={
+                    'Current Rating Probability': st.column_config.ProgressColumn(format='%.2f', min_value=0, max_value=1),
+                    **{grade: st.column_config.NumberColumn(format='%.3f') for grade in grades}
+                },
+                use_container_width=True
+            )
+
+        if params['date'] != all_dates:
+            fig = charts.grade_distribution_figure(df_sensitivity, grades)
+            perf.payload('plotly_chart', lambda: len(figure_json(fig)))
+            st.plotly_chart(fig, use_container_width=True)
+
+elif job is not None:
+    session_frames.progress(job)
+else:
+    st.markdown(
+        "<div style='text-align: left; font-size: 18px; font-weight: normal; font-family: Arial';"
+        ">No dataframe uploaded. Please upload file in <b><i>Data Upload and Information</i></b> section!</div>",
+        unsafe_allow_html=True
+    )
+
+perf.sidebar_panel()
@@ -0,0 +1,80 @@
+import streamlit as st
+
+from camels import charts, perf, session_frames
+from camels.dataset_store import session_entry
+from camels.figure_cache import figure_json
+from camels.migration import RatingMigrations
+
+# Set options
+st.set_page_config(page_title='CAMELS and Market Analysis Dashboard', layout='wide')
+perf.begin_run('Rating Migration')
+
+# Results of an upload still processed in the background are picked up once its pipeline finished
+job = session_frames.pick_up()
+
+# Gets data from session state
+df_ratings = st.session_state.get('ratings')
+panel_index = st.session_state.get('panel_index')
+
+all_pairs = 'All date pairs'
+
+# Migration Functions, matrices are shared by the sessions of a dataset per ratings key and horizon
+def migrations(df_ratings, horizon):
+    def build():
+        with st.spinner('Counting Rating Migrations ... '):
+            return RatingMigrations(df_ratings, [horizon])
+    return session_entry(('migration', st.session_state['ratings_key'], horizon), build)
+
+# Checks if Data is Uploaded
+if df_ratings is not None:
+
+    st.subheader('Rating Migration')
+    n_dates = len(panel_index.dates)
+    if n_dates < 2:
+        st.markdown(
+            "<div style='text-align: left; font-size: 18px; font-weight: normal; font-family: Arial';"
+            ">Rating migrations need at least two reporting dates.</div>",
+            unsafe_allow_html=True
+        )
+    else:
+        col1, col2, col3 = st.columns(3)
+        horizon = col1.number_input(r"$\textsf{\normalsize Horizon (reporting dates):}$", min_value=1, max_value=n_dates - 1,
+                                    step=1, value=1, key='migration_horizon')
+        with perf.stage('Rating migrations'):
+            rating_migrations = migrations(df_ratings, horizon)
+        pairs = rating_migrations.pairs(horizon)
+        pair_options = [all_pairs] + [f'{start} to {end}' for start, end in pairs]
+        selected = col2.selectbox(r"$\textsf{\normalsize Date Pair:}$", options=pair_options, key='migration_pair')
+        values = col3.radio(r"$\textsf{\normalsize Show:}$", options=['Probabilities', 'Counts'], horizontal=True, key='migration_values')
+        pair = None if selected == all_pairs else pair_options.index(selected) - 1
+        probabilities = values == 'Probabilities'
+
+        # Summary
+        summary = rating_migrations.summary(horizon, pair)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric('Upgrades', f"{summary['Upgrades']:.1%}")
+        col2.metric('Unchanged', f"{summary['Unchanged']:.1%}")
+        col3.metric('Downgrades', f"{summary['Downgrades']:.1%}")
+        col4.metric('Transitions', f"{summary['Transitions']:,}")
+
+        df_migration = rating_migrations.table(horizon, pair, probabilities)
+        title = f'Rating Migration Matrix, {selected}' if pair is not None else f'Rating Migration Matrix, {all_pairs} ({horizon} date horizon)'
+        with perf.stage('Render migration heatmap'):
+            fig = charts.migration_heatmap_figure(df_migration, probabilities, title)
+            perf.payload('plotly_chart', lambda: len(figure_json(fig)))
+            st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("<div style='text-align: center; font-size: 18px; font-weight: normal; font-family: Arial';"
+                ">Rating Migration Counts</div>", unsafe_allow_html=True)
+        st.dataframe(rating_migrations.table(horizon, pair, probabilities=False), use_container_width=True)
+
+elif job is not None:
+    session_frames.progress(job)
+else:
+    st.markdown(
+        "<div style='text-align: left; font-size: 18px; font-weight: normal; font-family: Arial';"
+        ">No dataframe uploaded. Please upload file in <b><i>Data Upload and Information</i></b> section!</div>",
+        unsafe_allow_html=True
+    )
+
+perf.sidebar_panel()
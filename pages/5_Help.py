@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
 
+from camels import perf
+
 st.set_page_config(page_title='CAMELS and Market Analysis Dashboard',layout='wide')
+perf.begin_run('Help')
 
 # Variables Description and Information Dictionary
 
@@ -170,6 +173,8 @@ with dashboard_help:
     - CAMELS Data Preview
     - CAMELS Visualizations
     - Market Analysis
+    - Weight Sensitivity
+    - Rating Migration
     - Help
              
     Pages section can be collapsed clicking on the < icon in the top right corner.
@@ -178,16 +183,32 @@ with dashboard_help:
     # Data Upload and Information Section
     st.markdown('#### Data Upload and Information')
     st.write('''
-    In the 'Drag and drop file here' section, user can input a file with necessary data for the CAMELS rating calculation. Only .xlsx file type is accepted, 
+    In the 'Drag and drop file here' section, user can input a file with necessary data for the CAMELS rating calculation. Accepted file types are .xlsx (sheet 'Institution_Data'), .csv, .parquet and Arrow IPC (.arrow, .feather, .ipc), 
              and only one file at a time can be uploaded. In case the user tries to load a file that is not in the correct format or containing wrong data types 
              (for example, string type in float section), the dashboard will display an error. User should double-check the file and correct the errors, then try 
              uploading again.
 
-    After the file is uploaded successfully, the message is displayed: 'File uploaded successfully and is stored in memory!'
+    After the file is uploaded successfully, the message is displayed: 'File uploaded successfully and is stored in memory!' Users uploading the same file share 
+             one parsed copy of it and of the derived CAMELS tables on the server, so a file another user already uploaded loads without recomputing them.
+             Parsing, the market loss rate, the CAMELS variables, the ratings and the market benchmarks run in the background with their progress shown stage by stage. 
+             The input preview and statistics are shown as soon as the file is parsed and the other tabs show their results once the last stage finished.
+
+    The 'Total Assets (t-1)', 'Total Assets (t-2)' and 'Total Assets (t-3)' columns can be left out of the input, they are then derived from the Total Assets 
+             of each institution at the previous reporting dates of the uploaded panel. With the 'Derive Total Assets ...' toggle on, the history is used even when 
+             the columns are given, and the given values only fill in where the history is missing (the first reporting dates of the panel, or a reporting date 
+             an institution skipped: its lags are left empty rather than taken from an older date). Without the columns, the Asset Growth Rate 3Y Average and 
+             the ROA of the first reporting dates are therefore missing.
 
     Below the displayed message, two dataframes are displayed:
-    - "CAMELS Input Dataframe Preview" which shows the currently uploaded .xlsx file
+    - "CAMELS Input Dataframe Preview" which shows the currently uploaded file, one page at a time. Rows can be filtered by date and institution, 
+             sorted by any column and browsed with the page number (the rows per page are capped for wide tables)
     - "CAMELS Input Dataframe Information" which shows basic dataframe information alongside descriptive statistics of the numerical data.
+
+    The "Model Calibration" section shows the binning method, thresholds and weights of every variable. After editing the table and clicking 'Apply', only the 
+             subratings of the variables with changed thresholds are recalculated (a weights change only recalculates the final rating). 'Reset to defaults' 
+             restores the original model calibration. Besides the expert thresholds, two data-driven binning methods are available: 'quantile' (thresholds 
+             at the 20%, 40%, 60% and 80% quantiles of the uploaded data, so every rating holds a fifth of the panel) and 'kmeans-1d' (thresholds halfway 
+             between the centers of five clusters of the variable values). Derived thresholds are listed below the table and used in the charts.
     ''')
 
     # CAMELS Data Preview Section
@@ -198,7 +219,8 @@ with dashboard_help:
     - "CAMELS Variables dataframe" which: shows CAMELS selected variables values.
 
     Both tables can be filtered by year (default value setting is to show all available years). When leaving the page, the page saves the Filter setting 
-             (selected year).
+             (selected year). Each table additionally has an institution filter, a sort column and page controls, only the rows of the selected page 
+             are sent to the browser.
 
     It's crucial to note that if there is missing data in the input table, the model cannot calculate the appropriate rating. In such cases, 
              the worst rating category (Rating E) is assigned instead.
@@ -232,6 +254,9 @@ with dashboard_help:
     - (S) Capital Adequacy: Shows a bar chart showing subratings of the selected Sensitivity component.
 
     CAMELS Visualizations page allows displaying results based on the selected year. It should be noted that missing values will show as 'None' in the bar plots without any rating category assigned.
+
+    With 'Render the selected tab only' switched on (default), the tabs are shown as a row of options and only the charts of the selected one are 
+             built and sent to the browser, while the next tab is prepared in the background. Switch it off to load all tabs at once.
     ''')
     st.markdown('###### Time Series Comparison')
     st.write('''
@@ -252,12 +277,39 @@ with dashboard_help:
     signals better results compared to the benchmark while **:red[red color]** signals worse results compared to the benchmark. It should be noted that both positive and negative values can indicate better results in 
     comparison to the benchmark (this depends on the interpretation of the variable).
     - Missing Data Handling: In order to have correct market analysis representation, data from all financial institutions should be filled in .xlsx file. If there is missing data, the cell is left blank and colored in black color.
+
+    
+    Benchmark Peers: by default every institution is compared with the whole market. Selecting 'Asset size' splits the institutions of each date into 
+    Small, Medium and Large terciles of Total Assets, and any text column of the input (e.g. a 'Bank Type' column) can be used as the grouping as well. 
+    The Peer Group selector then shows the institutions of one group compared with the benchmark of that group only, and the market shares become shares 
+    of the group. Benchmarks of all dates and groups are computed at once when a grouping is first selected.
     ''')
     st.markdown("<div style='text-align: left; font-size: 14px; font-weight: bold; font-style: italic; font-family: Arial';" 
         ">Note:</div>", unsafe_allow_html=True)
     st.write('''Benchmark values of Total Assets and Total Gross Loans are calculated as the sum, while the rest of the CAMELS variables are calculated as the
              average of the inputted Data.''')
 
+    # Weight Sensitivity Section
+    st.markdown('#### Weight Sensitivity')
+    st.write('''
+    This section shows how fragile the Final Rating of each financial institution is to the choice of variable weights. Weight vectors are sampled
+             around the current weights (Dirichlet distribution, a higher concentration means smaller perturbations) and every institution is rated with 
+             each of them. After selecting a date (or all dates), the number of samples and clicking 'Run', the page shows:
+    - The share of samples that give each Final Rating, the most likely rating and the probability of keeping the current rating.
+    - For a single date, a stacked bar chart of the rating probabilities, least stable ratings on top.
+    ''')
+
+    # Rating Migration Section
+    st.markdown('#### Rating Migration')
+    st.write('''
+    This section shows how financial institutions move between Final Ratings over time. For the selected horizon (number of reporting dates 
+             between the two ratings) and date pair, or all date pairs of that horizon together, the page shows:
+    - The share of upgrades, unchanged ratings and downgrades among the institutions rated at both dates.
+    - A heatmap of the migration matrix, rows are the starting rating and columns the rating at the later date. Probabilities are the share of 
+             the institutions of each starting rating, counts the number of institutions.
+    - The migration counts as a table.
+    ''')
+
 # CAMELS Variables Tab
 # with camels_variables_info:
 #     st.table(var_description_table(variables_description))
@@ -269,4 +321,6 @@ with rating_description:
             ">Note:</div>", unsafe_allow_html=True)
     st.write('''The Final Rating categories are further divided into plus (+) and minus (-) subcategories for finer 
              differentiation. Each of the five main rating categories is split into two subcategories: a plus (+) sign 
-             indicates the upper half of the threshold range, and a minus (-) sign indicates the lower half.''')
\ No newline at end of file
+             indicates the upper half of the threshold range, and a minus (-) sign indicates the lower half.''')
+
+perf.sidebar_panel()